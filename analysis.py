@@ -0,0 +1,343 @@
+import hashlib
+import os
+import re
+import time
+from functools import lru_cache
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from baseline import BASELINE_ENABLED, get_entity_baselines
+from cache import cache_key, get_response_cache, normalize_payload
+from coalesce import COALESCE_BATCH_TOKENS, COALESCED, combine_batches, pack_groups, split_sections
+from extraction import extract_assessment, parse_assessment
+from logmining import compact_log_batch
+from mapreduce import CHUNK_TOKEN_BUDGET, map_reduce_analyze, stream_content
+from metrics import ANALYSES, CACHE_LOOKUPS, instrumented, log_event, record_tokens, timed
+from prompts import SYSTEM_PROMPT_VERSION, combined_prompt_template, prompt_template, system_prompt
+from resilience import CircuitOpen, GuardedChatModel, is_retryable
+from routing import AUTO_MODEL, FAST_MODEL, ModelCall, get_model_router
+from similarity import SIMILARITY_MIN_SCORE, SIMILARITY_PROMPT_MATCHES, get_similarity_index, render_matches
+from store import get_store
+from tokens import estimate_tokens
+from triage import TRIAGE_ENABLED, get_triage_scorer
+
+# Model used for analyses that arrive outside of a browser session; "auto" routes per batch
+DEFAULT_MODEL = os.environ.get("ANALYSIS_MODEL", AUTO_MODEL)
+
+SYSTEM_PROMPT_TOKENS = estimate_tokens(system_prompt)
+
+# "fake" swaps Gemini for the deterministic model in fake_llm.py
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+FAKE_LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_FAILURE_RATE = float(os.environ.get("FAKE_LLM_FAILURE_RATE", "0"))
+
+
+# Initialize Gemini LLM with selected model
+@lru_cache(maxsize=None)
+@instrumented("get_llm")
+def get_llm(model_name):
+    """Model behind the shared rate limiter, retries and circuit breaker"""
+    if LLM_BACKEND == "fake":
+        # Deterministic offline model for benchmarks and local testing
+        from fake_llm import FakeChatModel
+        llm = FakeChatModel(model_name=model_name, latency=FAKE_LLM_LATENCY, failure_rate=FAKE_LLM_FAILURE_RATE)
+    else:
+        # Retries happen in the guard, where they respect the shared quota
+        llm = ChatGoogleGenerativeAI(model=model_name, temperature=0.6, max_retries=1)
+    return GuardedChatModel(inner=llm, model_name=model_name)
+
+
+# Function to extract analysis ID from webhook prompt
+@instrumented("extract_analysis_id")
+def extract_analysis_id(prompt_text):
+    """Extract analysis ID from webhook prompt"""
+    patterns = [
+        r"Analysis ID:\s*([a-zA-Z0-9-]+)",
+        r"REQUEST #([a-zA-Z0-9-]+)",
+        r"analysis request #([a-zA-Z0-9-]+)"
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, prompt_text, re.IGNORECASE)
+        if match:
+            return match.group(1)
+    return None
+
+
+# Function to store analysis result
+@instrumented("store_analysis_result")
+def store_analysis_result(analysis_id, prompt, response_content, status, prompt_stored=False, **details):
+    """Store analysis result in the shared results store
+
+    With prompt_stored, the record saved earlier for the analysis keeps its
+    prompt and only its status and result fields are updated. Completed
+    responses are parsed once here into typed, indexed fields and added to
+    the similar-incident index.
+    """
+    if analysis_id:
+        if status == "completed":
+            details.update(_extract_fields(response_content))
+        store = get_store()
+        if not prompt_stored or not store.set_status(analysis_id, status, response_content, **details):
+            store.save(analysis_id, prompt, response_content, status, **details)
+        if status == "completed":
+            get_similarity_index().add(analysis_id, f"{prompt}\n{response_content}")
+        ANALYSES.inc(status=status)
+
+
+# Function to extract a completed response's typed fields
+def _extract_fields(response_content):
+    try:
+        return extract_assessment(response_content, llm=get_llm(FAST_MODEL))
+    except Exception as e:
+        # A model outage must not lose the finished analysis; anything else is a bug and is raised
+        if not (isinstance(e, CircuitOpen) or is_retryable(e)):
+            raise
+        log_event("assessment_fallback", reason="model unavailable", error=str(e)[:200])
+        return extract_assessment(response_content)
+
+
+# Function to clear stored analysis results
+def clear_analysis_results():
+    """Remove every stored analysis result"""
+    get_store().clear()
+    get_similarity_index().clear()
+
+
+# Function to create webhook hash for duplicate detection
+def get_webhook_hash(prompt):
+    """Full SHA-256 of the normalized webhook prompt, used to detect duplicates"""
+    return hashlib.sha256(normalize_payload(prompt).encode()).hexdigest()
+
+
+class PreparedBatch:
+    """A log batch taken up to the model call
+
+    content is already set when the cache or triage answered the batch.
+    first_pass holds a coalesced fast-model answer that still has to be
+    escalated.
+    """
+
+    def __init__(self, analysis_id, log_text, model_name, on_token):
+        self.analysis_id = analysis_id
+        self.log_text = log_text
+        self.model_name = model_name
+        self.on_token = on_token or (lambda token: None)
+        self.key = cache_key(log_text, model_name, SYSTEM_PROMPT_VERSION)
+        self.decision = None
+        self.details = {}
+        self.content = None
+        self.compact = None
+        self.prompt_text = None
+        self.prompt_tokens = 0
+        self.first_pass = None
+
+    @property
+    def coalescable(self):
+        """Whether the batch still needs the model and is small enough to share a call"""
+        return self.content is None and self.prompt_tokens <= COALESCE_BATCH_TOKENS
+
+
+# Function to analyze a log batch outside of the chat session
+def analyze_log_batch(log_text, model_name=DEFAULT_MODEL, on_token=None):
+    """Run the system prompt over a log batch
+
+    Response text is passed to on_token as it streams in. Returns the full
+    response text and a dict of details to store with it.
+    """
+    batch = prepare_log_batch(None, log_text, model_name, on_token)
+    if batch.content is None:
+        analyze_prepared(batch)
+    return batch.content, batch.details
+
+
+# Function to analyze small prepared batches in shared model calls
+def analyze_coalesced(batches):
+    """Send coalescable batches bound for the same model in combined calls of up to COALESCE_MAX_TOKENS
+
+    Each batch gets back its own section of the response. Returns the
+    indexes of batches left for analyze_prepared (the only one in their
+    call, left out of the response, or escalated to the strong model) and
+    a dict of the exception raised for each batch whose call failed.
+    """
+    groups = {}
+    for index, batch in enumerate(batches):
+        # Small batches always start on the fast model when routed
+        model_name = FAST_MODEL if batch.model_name == AUTO_MODEL else batch.model_name
+        groups.setdefault(model_name, []).append((index, batch.prompt_tokens))
+
+    pending, errors = [], {}
+    for model_name, members in groups.items():
+        for group in pack_groups(members):
+            if len(group) == 1:
+                pending.extend(group)
+                continue
+            try:
+                pending.extend(_run_combined(model_name, [batches[index] for index in group], group))
+            except Exception as e:
+                errors.update((index, e) for index in group if batches[index].content is None)
+    return pending, errors
+
+
+# Function to take a batch through the cache, baselines, triage and template mining
+def prepare_log_batch(analysis_id, log_text, model_name=DEFAULT_MODEL, on_token=None):
+    batch = PreparedBatch(analysis_id, log_text, model_name, on_token)
+    cache = get_response_cache()
+    cached = cache.get(batch.key)
+    CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        batch.on_token(cached)
+        batch.content = cached
+        return batch
+
+    # Every batch, even one triage bypasses, updates the per-user and per-host baselines
+    deltas = None
+    if BASELINE_ENABLED:
+        with timed("baseline"):
+            deltas = get_entity_baselines().observe(log_text)
+
+    # Score the batch locally; routine traffic gets a templated LOW result
+    if TRIAGE_ENABLED:
+        with timed("triage"):
+            batch.decision = get_triage_scorer().triage(log_text)
+        batch.details["triage_score"] = round(batch.decision.score, 3)
+        if not batch.decision.escalate and not batch.decision.shadow:
+            batch.details["route"] = "triage"
+            batch.content = batch.decision.low_risk_response()
+            batch.on_token(batch.content)
+            return batch
+
+    # Collapse repetitive lines into templates before they reach the model
+    with timed("template_mining"):
+        batch.compact = compact_log_batch(log_text)
+    # Precomputed deviations from normal stand in for long raw history
+    context = [deltas.render() if deltas else ""]
+    if SIMILARITY_PROMPT_MATCHES:
+        with timed("similar_incidents"):
+            matches = get_similarity_index().search(log_text, SIMILARITY_PROMPT_MATCHES, min_score=SIMILARITY_MIN_SCORE)
+        context.append(render_matches(matches))
+    batch.prompt_text = "\n\n".join([block for block in context if block] + [batch.compact.text])
+    batch.prompt_tokens = estimate_tokens(batch.prompt_text)
+    return batch
+
+
+# Function to run the model over one prepared batch
+def analyze_prepared(batch):
+    if batch.first_pass is not None:
+        section, calls = batch.first_pass
+        content, chunks, routing = _escalate(batch.prompt_text, section, 1, calls, "coalesced small batch", batch.on_token)
+        batch.details.update(routing)
+    elif batch.model_name != AUTO_MODEL:
+        content, chunks, _ = _run_model(batch.model_name, batch.prompt_text, batch.on_token)
+        batch.details.update(model=batch.model_name, route="manual")
+    else:
+        content, chunks, routing = _run_routed(batch.prompt_text, batch.decision, batch.on_token)
+        batch.details.update(routing)
+    _finish_batch(batch, content, chunks)
+
+
+# Function to record a batch's final response
+def _finish_batch(batch, content, chunks):
+    if batch.decision is not None:
+        get_triage_scorer().record_outcome(batch.decision, parse_assessment(content)["threat_level"])
+    get_response_cache().put(batch.key, content)
+    batch.details.update(reduction_ratio=round(batch.compact.reduction_ratio, 2), chunks=chunks)
+    batch.content = content
+
+
+# Function to analyze several small batches in one model call
+def _run_combined(model_name, batches, indexes):
+    """Send batches to model_name together and finish each from its section
+
+    Returns the indexes of batches whose section is missing from the
+    response, or whose section asks for the strong model.
+    """
+    prompt_text = combine_batches([batch.analysis_id for batch in batches], [batch.prompt_text for batch in batches])
+    start = time.perf_counter()
+    with timed("llm_call", model=model_name):
+        content = (combined_prompt_template | get_llm(model_name)).invoke(
+            {"count": len(batches), "input": prompt_text}
+        ).content
+    seconds = time.perf_counter() - start
+    record_tokens(model_name, SYSTEM_PROMPT_TOKENS + estimate_tokens(prompt_text), estimate_tokens(content))
+    sections = split_sections(content)
+
+    router = get_model_router()
+    missing, pending = [], []
+    for number, (index, batch) in enumerate(zip(indexes, batches), 1):
+        section = sections.get(number)
+        COALESCED.inc(result="missing" if section is None else "split")
+        if section is None:
+            missing.append(index)
+            continue
+        batch.on_token(section)
+        # Each batch is charged its own tokens and an even share of the system prompt
+        call = ModelCall(
+            model_name,
+            SYSTEM_PROMPT_TOKENS // len(batches) + batch.prompt_tokens,
+            estimate_tokens(section),
+            seconds
+        )
+        batch.details["coalesced"] = len(batches)
+        if batch.model_name == AUTO_MODEL:
+            batch.first_pass = (section, [call])
+            if router.escalation_reason(parse_assessment(section)):
+                # The strong model re-analysis runs as its own task
+                pending.append(index)
+                continue
+            section, chunks, routing = _escalate(batch.prompt_text, section, 1, [call], "coalesced small batch", batch.on_token)
+            batch.details.update(routing)
+        else:
+            chunks = 1
+            batch.details.update(model=model_name, route="manual")
+        _finish_batch(batch, section, chunks)
+    if missing:
+        log_event("coalesce_missing_sections", model=model_name, batches=len(batches), missing=len(missing))
+    return missing + pending
+
+
+# Function to run one model pass over a prepared batch
+def _run_model(model_name, prompt_text, on_token):
+    llm = get_llm(model_name)
+    prompt_tokens = estimate_tokens(prompt_text)
+    start = time.perf_counter()
+    with timed("llm_call", model=model_name):
+        if prompt_tokens > CHUNK_TOKEN_BUDGET:
+            content, chunks = map_reduce_analyze(llm, prompt_text, on_token=on_token)
+        else:
+            content, chunks = stream_content((prompt_template | llm).stream({"input": prompt_text}), on_token), 1
+    call = ModelCall(
+        model_name,
+        SYSTEM_PROMPT_TOKENS * chunks + prompt_tokens,
+        estimate_tokens(content),
+        time.perf_counter() - start
+    )
+    record_tokens(model_name, call.prompt_tokens, call.completion_tokens)
+    return content, chunks, call
+
+
+# Function to pick the model for a batch and escalate when the first pass asks for it
+def _run_routed(prompt_text, decision, on_token):
+    """Fast model first; the strong model only re-analyzes what the first pass flags"""
+    router = get_model_router()
+    model_name, reason = router.first_model(estimate_tokens(prompt_text), decision.score if decision else None)
+    content, chunks, call = _run_model(model_name, prompt_text, on_token)
+    if model_name == router.strong_model:
+        router.record("direct", [call], reason)
+        return content, chunks, {"model": call.model_name, "route": "direct"}
+    return _escalate(prompt_text, content, chunks, [call], reason, on_token)
+
+
+# Function to re-analyze a fast first pass with the strong model when it asks for it
+def _escalate(prompt_text, content, chunks, calls, reason, on_token):
+    router = get_model_router()
+    route = "fast"
+    escalation = router.escalation_reason(parse_assessment(content))
+    if escalation:
+        reason, route = escalation, "escalated"
+        on_token(f"\n\n---\n🔁 *Escalating to {router.strong_model}: {escalation}*\n\n")
+        content, chunks, call = _run_model(router.strong_model, prompt_text, on_token)
+        calls = calls + [call]
+
+    router.record(route, calls, reason)
+    return content, chunks, {"model": calls[-1].model_name, "route": route}
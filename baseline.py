@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from events import parse_event
+from metrics import gauge
+
+# Baseline settings (overridable through the environment)
+BASELINE_ENABLED = os.environ.get("BASELINE_ENABLED", "1") == "1"
+BASELINE_CAPACITY = int(os.environ.get("BASELINE_CAPACITY", "50000"))
+# Weight of the newest batch in each rolling statistic
+BASELINE_ALPHA = float(os.environ.get("BASELINE_ALPHA", "0.1"))
+# Batches an entity must appear in before deviations are reported
+BASELINE_MIN_BATCHES = int(os.environ.get("BASELINE_MIN_BATCHES", "3"))
+BASELINE_MAX_LINES = int(os.environ.get("BASELINE_MAX_LINES", "10"))
+
+# Recent source IPs remembered per entity
+IP_SLOTS = 8
+# Hours holding less than this share of an entity's activity are unusual for it
+UNUSUAL_HOUR_SHARE = 0.02
+# Deviations at or above these are reported
+VOLUME_Z_THRESHOLD = 3.0
+UNUSUAL_HOURS_THRESHOLD = 0.5
+
+DELTAS_HEADER = "BEHAVIORAL BASELINE DELTAS (this batch compared with each user's and host's rolling baseline):"
+
+
+class EntityActivity:
+    """What one user or host did within a single batch"""
+
+    def __init__(self):
+        self.events = 0
+        self.files = 0
+        self.hours = np.zeros(24, dtype=np.float32)
+        self.ips = set()
+
+    def add(self, event):
+        self.events += 1
+        if event["file"]:
+            self.files += 1
+        if event["time"]:
+            self.hours[event["time"].hour] += 1
+        if event["src_ip"]:
+            self.ips.add(event["src_ip"])
+
+
+class EntityDelta:
+    """Deviation of one entity's batch activity from its baseline"""
+
+    def __init__(self, kind, name, activity, batches, volume=None, files=None, unusual_hours=0.0, new_ips=()):
+        self.kind = kind
+        self.name = name
+        self.activity = activity
+        self.batches = batches
+        # (count, baseline mean, baseline std, z-score) of events and file accesses
+        self.volume = volume
+        self.files = files
+        self.unusual_hours = unusual_hours
+        self.new_ips = sorted(new_ips)
+
+    @property
+    def first_seen(self):
+        return self.batches == 0
+
+    @property
+    def score(self):
+        z_scores = [stat[3] for stat in (self.volume, self.files) if stat]
+        return (
+            2 * self.unusual_hours
+            + max([0.0] + z_scores) / VOLUME_Z_THRESHOLD
+            + min(len(self.new_ips), 3)
+            + 0.5 * self.first_seen
+        )
+
+    @property
+    def notable(self):
+        if self.first_seen:
+            return True
+        return (
+            self.unusual_hours >= UNUSUAL_HOURS_THRESHOLD
+            or bool(self.new_ips)
+            or any(stat and stat[3] >= VOLUME_Z_THRESHOLD for stat in (self.volume, self.files))
+        )
+
+    def render(self):
+        if self.first_seen:
+            return f"- {self.kind} {self.name}: first seen ({self.activity.events} events)"
+        parts = []
+        for label, stat in (("events", self.volume), ("file accesses", self.files)):
+            if stat and stat[3] >= VOLUME_Z_THRESHOLD:
+                count, mean, std, z = stat
+                parts.append(f"{count} {label} vs. usual {mean:.1f}±{std:.1f} (z=+{z:.1f})")
+        if self.unusual_hours >= UNUSUAL_HOURS_THRESHOLD:
+            hours = ", ".join(f"{hour:02d}:00" for hour in np.flatnonzero(self.activity.hours))
+            parts.append(f"{self.unusual_hours:.0%} of activity at hours unusual for it ({hours})")
+        if self.new_ips:
+            parts.append(f"{len(self.new_ips)} new source IP(s): {', '.join(self.new_ips[:3])}")
+        return f"- {self.kind} {self.name} ({self.batches} prior batches): " + "; ".join(parts)
+
+
+class BaselineTable:
+    """Rolling statistics for one kind of entity, one preallocated array row each
+
+    When every row is taken the least recently seen entity gives up its row.
+    """
+
+    def __init__(self, kind, capacity=BASELINE_CAPACITY, alpha=BASELINE_ALPHA):
+        self.kind = kind
+        self.capacity = capacity
+        self.alpha = alpha
+        self.rows = {}
+        self.names = [None] * capacity
+        self.hours = np.zeros((capacity, 24), dtype=np.float32)
+        # Mean and variance of events and file accesses per batch
+        self.volume = np.zeros((capacity, 2), dtype=np.float32)
+        self.files = np.zeros((capacity, 2), dtype=np.float32)
+        self.batches = np.zeros(capacity, dtype=np.int32)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        self.ips = np.zeros((capacity, IP_SLOTS), dtype=np.uint32)
+        self.ip_cursor = np.zeros(capacity, dtype=np.int8)
+
+    def _row(self, name, now):
+        row = self.rows.get(name)
+        if row is None:
+            if len(self.rows) < self.capacity:
+                row = len(self.rows)
+            else:
+                row = int(np.argmin(self.last_seen))
+                del self.rows[self.names[row]]
+                self._reset(row)
+            self.rows[name] = row
+            self.names[row] = name
+        self.last_seen[row] = now
+        return row
+
+    def _reset(self, row):
+        for array in (self.hours, self.volume, self.files, self.batches, self.ips, self.ip_cursor):
+            array[row] = 0
+
+    def compare(self, name, activity):
+        """Delta of a batch's activity against the entity's baseline, before it is updated"""
+        row = self.rows.get(name)
+        batches = int(self.batches[row]) if row is not None else 0
+        if batches == 0:
+            return EntityDelta(self.kind, name, activity, 0)
+        if batches < BASELINE_MIN_BATCHES:
+            return None
+
+        stats = {}
+        for attribute, count in (("volume", activity.events), ("files", activity.files)):
+            mean, variance = getattr(self, attribute)[row]
+            std = float(np.sqrt(variance))
+            stats[attribute] = (count, float(mean), std, float((count - mean) / max(std, 1.0)))
+
+        unusual_hours = 0.0
+        timed_events = activity.hours.sum()
+        total = self.hours[row].sum()
+        if timed_events and total:
+            usual = self.hours[row] / total
+            unusual_hours = float(activity.hours[usual < UNUSUAL_HOUR_SHARE].sum() / timed_events)
+        known = set(self.ips[row].tolist())
+        new_ips = [ip for ip in activity.ips if _ip_hash(ip) not in known]
+        return EntityDelta(self.kind, name, activity, batches, stats["volume"], stats["files"], unusual_hours, new_ips)
+
+    def update(self, name, activity, now):
+        """Fold a batch's activity into the entity's rolling statistics"""
+        row = self._row(name, now)
+        first = self.batches[row] == 0
+        for array, count in ((self.volume, activity.events), (self.files, activity.files)):
+            if first:
+                array[row] = (count, 0.0)
+            else:
+                mean, variance = array[row]
+                diff = count - mean
+                array[row] = (mean + self.alpha * diff, (1 - self.alpha) * (variance + self.alpha * diff * diff))
+        self.hours[row] = self.hours[row] * (1 - self.alpha) + activity.hours
+        for ip in activity.ips:
+            ip_hash = _ip_hash(ip)
+            if ip_hash not in self.ips[row]:
+                self.ips[row, self.ip_cursor[row]] = ip_hash
+                self.ip_cursor[row] = (self.ip_cursor[row] + 1) % IP_SLOTS
+        self.batches[row] += 1
+
+
+def _ip_hash(ip):
+    # 0 marks an empty slot
+    return zlib.crc32(ip.encode()) or 1
+
+
+class BaselineDeltas:
+    """Notable deviations found in one batch"""
+
+    def __init__(self, deltas, entities):
+        self.deltas = sorted((delta for delta in deltas if delta.notable), key=lambda delta: delta.score, reverse=True)
+        self.entities = entities
+
+    def render(self, max_lines=BASELINE_MAX_LINES):
+        """Compact block to prepend to the prompt, or an empty string"""
+        if not self.deltas:
+            return ""
+        lines = [DELTAS_HEADER] + [delta.render() for delta in self.deltas[:max_lines]]
+        hidden = len(self.deltas) - max_lines
+        if hidden > 0:
+            lines.append(f"(+{hidden} more entities with smaller deviations)")
+        return "\n".join(lines)
+
+
+class EntityBaselines:
+    """Per-user and per-host behavioral baselines fed by every analyzed batch"""
+
+    def __init__(self, capacity=BASELINE_CAPACITY, alpha=BASELINE_ALPHA):
+        self.tables = {
+            "user": BaselineTable("user", capacity, alpha),
+            "host": BaselineTable("host", capacity, alpha),
+        }
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def observe(self, log_text):
+        """Compare a batch with the baselines, then fold it into them"""
+        activity = {"user": defaultdict(EntityActivity), "host": defaultdict(EntityActivity)}
+        for line in log_text.splitlines():
+            if not line.strip():
+                continue
+            event = parse_event(line)
+            for kind in activity:
+                if event[kind]:
+                    activity[kind][event[kind]].add(event)
+
+        now = time.time()
+        deltas = []
+        with self._lock:
+            # Until a few batches are in, every entity is new and that says nothing
+            warmed_up = self.batches >= BASELINE_MIN_BATCHES
+            for kind, table in self.tables.items():
+                for name, entity_activity in activity[kind].items():
+                    delta = table.compare(name, entity_activity)
+                    if delta is not None and (warmed_up or not delta.first_seen):
+                        deltas.append(delta)
+                    table.update(name, entity_activity, now)
+            self.batches += 1
+        return BaselineDeltas(deltas, sum(len(entities) for entities in activity.values()))
+
+    def stats(self):
+        with self._lock:
+            return {"batches": self.batches, **{f"{kind}s": len(table.rows) for kind, table in self.tables.items()}}
+
+
+# Shared baselines so every session and the ingest endpoint learn the same normal
+@lru_cache(maxsize=None)
+def get_entity_baselines():
+    baselines = EntityBaselines()
+    gauge(
+        "criblbot_baseline_entities",
+        "Users and hosts with a behavioral baseline",
+        lambda: [({"kind": kind}, len(table.rows)) for kind, table in baselines.tables.items()]
+    )
+    return baselines
@@ -0,0 +1,368 @@
+"""Offline benchmarks for the webhook flow
+
+Runs against the deterministic fake model and a throwaway SQLite store, so no
+Gemini calls are made:
+
+    python benchmark.py
+    python benchmark.py --scenarios storage,dashboard --sizes 10,1000,100000
+    python benchmark.py --json current.json --baseline main.json --tolerance 0.25
+    python benchmark.py --scenarios ingest --rpm 60 --failure-rate 0.2
+
+With --baseline the run exits non-zero when a scenario's throughput drops, or
+its p99 latency grows, by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+SCENARIOS = ["ingest", "dedup", "storage", "dashboard"]
+
+USERS = [f"user{i:03d}" for i in range(200)] + ["svc_backup", "admin", "root"]
+HOSTS = [f"ws-{i:03d}" for i in range(60)] + ["fileserver-01", "dc-01", "vpn-gw", "hr-db"]
+FILES = ["/srv/hr/payroll.xlsx", "/srv/eng/roadmap.docx", "/home/shared/notes.txt", "C:\\Finance\\q3.pdf", "/etc/passwd"]
+
+
+# Function to build one synthetic Cribl event
+def synthetic_event(rng, when):
+    """Random auth, file or network event shaped like Cribl's JSON output"""
+    kind = rng.choices(["auth", "file", "network"], weights=[5, 3, 2])[0]
+    event = {
+        "_time": round(when.timestamp(), 3),
+        "host": rng.choice(HOSTS),
+        "user": rng.choice(USERS),
+        "sourcetype": kind,
+    }
+    if kind == "auth":
+        failed = rng.random() < 0.1
+        event.update(
+            action="login_failure" if failed else "login_success",
+            event_id=4625 if failed else 4624,
+            src_ip=f"10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+        )
+    elif kind == "file":
+        event.update(action=rng.choice(["read", "read", "write", "delete"]), file=rng.choice(FILES), bytes=rng.randint(100, 10 ** 7))
+    else:
+        event.update(
+            src_ip=f"10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            dest_ip=f"172.16.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            dest_port=rng.choice([22, 80, 443, 445, 3389]),
+            bytes_out=rng.randint(100, 10 ** 6),
+        )
+    return event
+
+
+# Function to build one NDJSON webhook body
+def synthetic_batch(rng, size, duplication_rate, start):
+    """NDJSON body of size events; duplication_rate of them repeat earlier events"""
+    events = []
+    for i in range(size):
+        if events and rng.random() < duplication_rate:
+            events.append(rng.choice(events))
+        else:
+            events.append(synthetic_event(rng, start + timedelta(seconds=i)))
+    return "\n".join(json.dumps(event) for event in events).encode()
+
+
+# Function to build a stream of webhook deliveries
+def synthetic_batches(count, size, duplication_rate=0.3, replay_rate=0.1, seed=7):
+    """count NDJSON bodies; replay_rate of them are exact resends of earlier ones"""
+    rng = random.Random(seed)
+    start = datetime(2024, 5, 1, 8, 0, 0)
+    bodies = []
+    for i in range(count):
+        if bodies and rng.random() < replay_rate:
+            bodies.append(rng.choice(bodies))
+        else:
+            bodies.append(synthetic_batch(rng, size, duplication_rate, start + timedelta(minutes=i)))
+    return bodies
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Measurement:
+    """Throughput, latency percentiles and Python heap growth of one scenario"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.ops = 0
+        self.extra = {}
+
+    def __enter__(self):
+        tracemalloc.start()
+        self._heap_start = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.memory_growth = current - self._heap_start
+        self.memory_peak = peak - self._heap_start
+        return False
+
+    def to_dict(self):
+        return {
+            "scenario": self.name,
+            "ops": self.ops,
+            "seconds": round(self.seconds, 4),
+            "throughput": round(self.ops / self.seconds, 2) if self.seconds else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 3),
+            "memory_growth_kb": round(self.memory_growth / 1024, 1),
+            "memory_peak_kb": round(self.memory_peak / 1024, 1),
+            **self.extra,
+        }
+
+
+# Scenario: webhook bodies through parsing, the job queue and the fake model
+def bench_ingest(args):
+    from analysis import extract_analysis_id, get_webhook_hash
+    from ingest import format_batch, parse_events
+    from jobs import JobQueue
+
+    bodies = synthetic_batches(args.batches, args.batch_size, args.duplication_rate, args.replay_rate)
+    queue = JobQueue(max_workers=args.workers, max_pending=len(bodies))
+    with Measurement("ingest") as measurement:
+        jobs = []
+        for body in bodies:
+            log_text = format_batch(parse_events(body))
+            analysis_id = extract_analysis_id(log_text) or f"auto_{get_webhook_hash(log_text)}"
+            jobs.append(queue.submit(analysis_id, log_text))
+        for job in jobs:
+            job.wait()
+        measurement.ops = len(jobs)
+        measurement.latencies = [job.finished_at - job.created_at for job in jobs]
+        measurement.extra = {
+            "events_per_second": round(len(jobs) * args.batch_size / (time.perf_counter() - measurement._start), 1),
+            "errors": sum(1 for job in jobs if job.status == "error"),
+            "coalesced": sum(1 for job in jobs if job.details.get("coalesced")),
+        }
+    return [measurement]
+
+
+# Scenario: duplicate detection over replayed deliveries
+def bench_dedup(args):
+    from analysis import get_webhook_hash
+    from dedup import DedupService
+
+    bodies = [body.decode() for body in synthetic_batches(args.batches * 10, args.batch_size, args.duplication_rate, args.replay_rate)]
+    service = DedupService(os.path.join(args.workdir, "dedup.db"))
+    with Measurement("dedup") as measurement:
+        duplicates = 0
+        for body in bodies:
+            start = time.perf_counter()
+            if not service.claim(get_webhook_hash(body)):
+                duplicates += 1
+            measurement.latencies.append(time.perf_counter() - start)
+        measurement.ops = len(bodies)
+        measurement.extra = {"duplicates": duplicates, "distinct_bodies": len(set(bodies))}
+    return [measurement]
+
+
+def _seed_store(path, size, rng):
+    from store import AnalysisStore
+
+    store = AnalysisStore(path)
+    start = datetime(2024, 1, 1)
+    levels = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+    for offset in range(0, size, 10000):
+        store.save_many([
+            {
+                "analysis_id": f"seed-{i}",
+                "timestamp": (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                "status": "completed",
+                "threat_level": levels[i % 4],
+                "risk_score": rng.randint(1, 10),
+                "prompt": f"seed batch {i}",
+                "response": f"THREAT LEVEL: {levels[i % 4]}",
+            }
+            for i in range(offset, min(size, offset + 10000))
+        ])
+    return store
+
+
+# Scenario: storing results at growing store sizes
+def bench_storage(args):
+    from extraction import extract_assessment
+    from fake_llm import fake_response
+
+    rng = random.Random(11)
+    measurements = []
+    for size in args.sizes:
+        store = _seed_store(os.path.join(args.workdir, f"storage-{size}.db"), size, rng)
+        prompts = [body.decode() for body in synthetic_batches(args.storage_ops, 5, 0.0, 0.0, seed=size)]
+        with Measurement(f"storage@{size}") as measurement:
+            for i, prompt in enumerate(prompts):
+                start = time.perf_counter()
+                # Mirrors store_analysis_result against this store
+                response = fake_response(prompt)
+                store.save(f"bench-{i}", prompt, response, "completed", **extract_assessment(response))
+                measurement.latencies.append(time.perf_counter() - start)
+            measurement.ops = len(prompts)
+        measurements.append(measurement)
+    return measurements
+
+
+# Scenario: the queries behind one dashboard render at growing store sizes
+def bench_dashboard(args):
+    rng = random.Random(13)
+    measurements = []
+    for size in args.sizes:
+        store = _seed_store(os.path.join(args.workdir, f"dashboard-{size}.db"), size, rng)
+        with Measurement(f"dashboard@{size}") as measurement:
+            for render in range(args.dashboard_renders):
+                start = time.perf_counter()
+                order = "risk" if render % 2 else "newest"
+                threat_level = [None, "CRITICAL"][render % 2]
+                cursor = None
+                # Walk a few pages, as an analyst clicking Next would
+                for _ in range(3):
+                    page = store.page(limit=21, before=cursor, threat_level=threat_level, order=order)
+                    if len(page) < 21:
+                        break
+                    cursor = store.cursor(page[-2], order)
+                store.count(threat_level=threat_level)
+                if page:
+                    store.get(page[0]["analysis_id"])
+                measurement.latencies.append(time.perf_counter() - start)
+            measurement.ops = args.dashboard_renders
+        measurements.append(measurement)
+        if args.render:
+            measurements.append(_bench_render(args, store.path, size))
+    return measurements
+
+
+def _bench_render(args, db_path, size):
+    # Full headless script runs of the dashboard view through Streamlit's AppTest
+    from streamlit.testing.v1 import AppTest
+
+    import store
+
+    # The app runs in this process, so repoint its shared store at the seeded database
+    store.ANALYSIS_DB_PATH = db_path
+    store.get_store.cache_clear()
+    errors = 0
+    with Measurement(f"render@{size}") as measurement:
+        for _ in range(args.render_runs):
+            app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook.py"), default_timeout=60)
+            app.secrets["GEMINI_API_KEY"] = "offline-benchmark"
+            app.session_state["show_results"] = True
+            start = time.perf_counter()
+            app.run()
+            measurement.latencies.append(time.perf_counter() - start)
+            errors += len(app.exception)
+        measurement.ops = args.render_runs
+        measurement.extra = {"rows": store.get_store().count(), "errors": errors}
+    return measurement
+
+
+BENCHMARKS = {
+    "ingest": bench_ingest,
+    "dedup": bench_dedup,
+    "storage": bench_storage,
+    "dashboard": bench_dashboard,
+}
+
+
+# Function to compare a run against a saved baseline
+def find_regressions(results, baseline, tolerance):
+    """Scenarios whose throughput fell or p99 rose by more than tolerance"""
+    previous = {result["scenario"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        if before["throughput"] and result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: throughput {before['throughput']} -> {result['throughput']}")
+        if before["p99_ms"] and result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{result['scenario']}: p99 {before['p99_ms']}ms -> {result['p99_ms']}ms")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--sizes", default="10,1000,100000", help="stored-result counts for storage and dashboard")
+    parser.add_argument("--batches", type=int, default=200, help="webhook deliveries for the ingest scenario")
+    parser.add_argument("--batch-size", type=int, default=50, help="events per delivery")
+    parser.add_argument("--duplication-rate", type=float, default=0.3, help="share of events repeated within a batch")
+    parser.add_argument("--replay-rate", type=float, default=0.1, help="share of deliveries that are resends")
+    parser.add_argument("--workers", type=int, default=4, help="analysis worker threads")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of fake model calls failing with a quota error")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute allowed per model (0 for no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute allowed per model (0 for no limit)")
+    parser.add_argument("--coalesce-window", type=float, help="seconds deliveries wait to share a model call (0 disables)")
+    parser.add_argument("--storage-ops", type=int, default=1000, help="results stored per size")
+    parser.add_argument("--dashboard-renders", type=int, default=200, help="dashboard query cycles per size")
+    parser.add_argument("--render", action="store_true", help="also time full headless Streamlit dashboard runs")
+    parser.add_argument("--render-runs", type=int, default=5, help="headless runs per size with --render")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to gate against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.workdir = tempfile.mkdtemp(prefix="criblbot-bench-")
+
+    # Isolate the run before any app module reads its configuration
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["GEMINI_RPM"] = str(args.rpm)
+    os.environ["GEMINI_TPM"] = str(args.tpm)
+    os.environ["ANALYSIS_DB_PATH"] = os.path.join(args.workdir, "analysis_results.db")
+    os.environ.pop("RESPONSE_CACHE_PATH", None)
+    # Any free port, so --render never collides with a running ingest server
+    os.environ["INGEST_PORT"] = "0"
+    if args.coalesce_window is not None:
+        os.environ["COALESCE_WINDOW"] = str(args.coalesce_window)
+
+    results = []
+    for name in args.scenarios:
+        for measurement in BENCHMARKS[name](args):
+            result = measurement.to_dict()
+            results.append(result)
+            print(
+                f"{result['scenario']:<20} {result['ops']:>7} ops  {result['throughput']:>10.1f}/s  "
+                f"p50 {result['p50_ms']:>9.3f}ms  p99 {result['p99_ms']:>9.3f}ms  "
+                f"heap +{result['memory_growth_kb']:.0f}KB (peak +{result['memory_peak_kb']:.0f}KB)"
+            )
+
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = find_regressions(results, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
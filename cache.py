@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from metrics import gauge
+
+# Response cache settings (overridable through the environment)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
+PRUNE_INTERVAL = 100
+
+
+# Function to normalize a log payload before hashing
+def normalize_payload(text):
+    """Strip surrounding whitespace and blank lines so resends hash the same"""
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+# Function to build the cache key for a model response
+def cache_key(payload, model_name, prompt_version):
+    """Full SHA-256 over the normalized payload, model and system prompt version"""
+    digest = hashlib.sha256()
+    for part in (normalize_payload(payload), model_name, prompt_version):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """LRU cache of model responses with TTL expiry and optional disk persistence"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, path=RESPONSE_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return the cached response for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.path:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                with self._lock:
+                    self._insert(key, row[0], row[1])
+                    self.hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._insert(key, value, expires_at)
+            self._puts += 1
+            prune = self._puts % PRUNE_INTERVAL == 0
+
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                if not prune:
+                    return
+                # Drop expired rows, then the soonest-expiring rows over the size cap
+                conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache "
+                    "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM response_cache")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _insert(self, key, value, expires_at):
+        # Caller holds the lock
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+# Shared cache used by every analysis path
+@lru_cache(maxsize=None)
+def get_response_cache():
+    cache = ResponseCache()
+    gauge("criblbot_response_cache_entries", "Entries held in memory by the response cache", lambda: [({}, len(cache._entries))])
+    return cache
@@ -0,0 +1,99 @@
+import os
+import re
+import threading
+
+from metrics import counter
+from routing import SMALL_BATCH_TOKENS
+
+# Micro-batching settings (overridable through the environment)
+# Seconds a delivery waits for others to share its model call (0 disables coalescing)
+COALESCE_WINDOW = float(os.environ.get("COALESCE_WINDOW", "0.5"))
+COALESCE_MAX_BATCHES = int(os.environ.get("COALESCE_MAX_BATCHES", "8"))
+# Batches up to this many prompt tokens are coalesced, into calls of at most COALESCE_MAX_TOKENS
+COALESCE_BATCH_TOKENS = int(os.environ.get("COALESCE_BATCH_TOKENS", str(SMALL_BATCH_TOKENS)))
+COALESCE_MAX_TOKENS = int(os.environ.get("COALESCE_MAX_TOKENS", "16000"))
+
+# Exactly "=== BATCH <n> ===" on its own line, with the "(analysis <id>)" label combine_batches adds to the input
+SECTION_RE = re.compile(r"^=== BATCH (\d+)(?: \(analysis [^\n]*\))? ===[ \t]*$", re.MULTILINE)
+
+COALESCED = counter("criblbot_coalesced_batches_total", "Batches sent in combined model calls, by whether their section came back")
+
+
+class Coalescer:
+    """Collects items and hands them to flush together
+
+    A group is flushed once max_items are waiting or window seconds after
+    its first item arrived, whichever comes first, so a lone delivery waits
+    at most window seconds.
+    """
+
+    def __init__(self, flush, window=COALESCE_WINDOW, max_items=COALESCE_MAX_BATCHES):
+        self.flush = flush
+        self.window = window
+        self.max_items = max_items
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        with self._lock:
+            self._pending.append(item)
+            if len(self._pending) < self.max_items:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self._expire)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            items = self._take()
+        self.flush(items)
+
+    def _expire(self):
+        with self._lock:
+            items = self._take()
+        if items:
+            self.flush(items)
+
+    def _take(self):
+        # Caller holds the lock
+        items, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return items
+
+
+# Function to pack coalescable batches into calls that fit the token budget
+def pack_groups(batches, max_tokens=COALESCE_MAX_TOKENS):
+    """Split (key, prompt tokens) pairs into consecutive groups of at most max_tokens, returning lists of keys"""
+    groups, current, current_tokens = [], [], 0
+    for key, tokens in batches:
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(key)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+# Function to build the input of a combined model call
+def combine_batches(analysis_ids, prompts):
+    """One section per batch, each under a numbered BATCH header naming its analysis ID"""
+    return "\n\n".join(
+        f"=== BATCH {number} (analysis {analysis_id or 'unnamed'}) ===\n{prompt}"
+        for number, (analysis_id, prompt) in enumerate(zip(analysis_ids, prompts), 1)
+    )
+
+
+# Function to split a combined response back into per-batch reports
+def split_sections(text):
+    """Map each BATCH number in text to the stripped text under its first header"""
+    matches = list(SECTION_RE.finditer(text))
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        number = int(match.group(1))
+        body = text[match.end():following.start() if following else len(text)].strip()
+        if body and number not in sections:
+            sections[number] = body
+    return sections
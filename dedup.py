@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from metrics import counter
+from store import ANALYSIS_DB_PATH
+
+# Duplicate suppression settings (overridable through the environment)
+DEDUP_DB_PATH = os.environ.get("DEDUP_DB_PATH", ANALYSIS_DB_PATH)
+DEDUP_WINDOW = int(os.environ.get("DEDUP_WINDOW", str(24 * 3600)))
+PRUNE_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_dedup (
+    key TEXT PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    deliveries INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_dedup_last_seen ON webhook_dedup (last_seen);
+"""
+
+DEDUP_CHECKS = counter("criblbot_dedup_checks_total", "Webhook duplicate checks by result and the path that answered")
+
+
+class DedupService:
+    """Time-windowed duplicate suppression shared by every session and replica
+
+    The SQLite table is the exact, shared record of which payloads were seen
+    in the window. A new payload is claimed with a single autocommitted
+    insert; only a key already in the table needs the locked lookup.
+    """
+
+    def __init__(self, path=DEDUP_DB_PATH, window=DEDUP_WINDOW):
+        self.path = path
+        self.window = window
+        self._claims = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key):
+        """Record a delivery of key, returning True if it is the first in the window"""
+        now = time.time()
+        conn = self._connect()
+        # Common case: a new payload is claimed by one insert, atomic on its own
+        first = conn.execute(
+            "INSERT OR IGNORE INTO webhook_dedup (key, first_seen, last_seen, deliveries) VALUES (?, ?, ?, 1)",
+            (key, now, now)
+        ).rowcount == 1
+        path = "insert"
+        if not first:
+            # Seen before, by this process, another replica, or in an expired window
+            path = "exact"
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT first_seen FROM webhook_dedup WHERE key = ?", (key,)).fetchone()
+                first = row is None or row[0] <= now - self.window
+                conn.execute(
+                    "INSERT INTO webhook_dedup (key, first_seen, last_seen, deliveries) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (key) DO UPDATE SET last_seen = excluded.last_seen, "
+                    "first_seen = CASE WHEN ? THEN excluded.first_seen ELSE first_seen END, "
+                    "deliveries = CASE WHEN ? THEN 1 ELSE deliveries + 1 END",
+                    (key, now, now, first, first)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        with self._lock:
+            self._claims += 1
+            prune = self._claims % PRUNE_INTERVAL == 0
+        if prune:
+            self.prune(now)
+        DEDUP_CHECKS.inc(result="new" if first else "duplicate", path=path)
+        return first
+
+    def release(self, key):
+        """Forget a claimed delivery that could not be processed, so a resend is accepted"""
+        self._connect().execute("DELETE FROM webhook_dedup WHERE key = ?", (key,))
+
+    def prune(self, now=None):
+        """Forget keys last delivered before the window"""
+        cutoff = (now or time.time()) - self.window
+        self._connect().execute("DELETE FROM webhook_dedup WHERE last_seen <= ?", (cutoff,))
+
+
+# Shared service used by the Streamlit webhook and the ingest endpoint
+@lru_cache(maxsize=None)
+def get_dedup_service():
+    return DedupService()
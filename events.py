@@ -0,0 +1,76 @@
+import json
+import re
+from datetime import datetime
+
+# Field names Cribl sources commonly use for the same attribute
+USER_KEYS = ("user", "username", "user_name", "userName", "src_user", "account", "TargetUserName")
+HOST_KEYS = ("host", "hostname", "computer", "Computer", "device", "dest_host")
+IP_KEYS = ("src_ip", "source_ip", "client_ip", "src", "ip", "IpAddress", "remote_addr")
+TIME_KEYS = ("_time", "timestamp", "time", "@timestamp", "eventTime")
+FILE_KEYS = ("file", "file_path", "path", "object", "ObjectName", "filename")
+
+USER_RE = re.compile(r"\b(?:user(?:name)?|account|for(?: invalid user)?)[=:\s]+\"?([\w.\\@$-]+)", re.IGNORECASE)
+HOST_RE = re.compile(r"\b(?:host(?:name)?|computer|device)[=:\s]+\"?([\w.-]+)", re.IGNORECASE)
+IP_RE = re.compile(r"\b(\d{1,3}(?:\.\d{1,3}){3})\b")
+TIME_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})[T ](\d{2}):(\d{2})")
+FILE_RE = re.compile(r"(?:[A-Za-z]:\\|/)[\w.\\/-]+\.\w{1,5}\b")
+
+
+def _first(event, keys):
+    for key in keys:
+        value = event.get(key)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        match = TIME_RE.search(value)
+        if not match:
+            return None
+        try:
+            return datetime.strptime(f"{match.group(1)} {match.group(2)}:{match.group(3)}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            return None
+    # Cribl _time is epoch seconds; tolerate milliseconds
+    try:
+        return datetime.fromtimestamp(seconds / 1000 if seconds > 1e11 else seconds)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+# Function to pull the entity fields out of one log line
+def parse_event(line):
+    """Return user, host, src_ip, time and file of a JSON or plain-text log line"""
+    event = None
+    if line.startswith("{"):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+
+    if isinstance(event, dict):
+        return {
+            "user": _first(event, USER_KEYS),
+            "host": _first(event, HOST_KEYS),
+            "src_ip": _first(event, IP_KEYS),
+            "time": _parse_time(_first(event, TIME_KEYS)),
+            "file": _first(event, FILE_KEYS),
+        }
+
+    user = USER_RE.search(line)
+    host = HOST_RE.search(line)
+    ip = IP_RE.search(line)
+    path = FILE_RE.search(line)
+    return {
+        "user": user.group(1) if user else None,
+        "host": host.group(1) if host else None,
+        "src_ip": ip.group(1) if ip else None,
+        "time": _parse_time(line),
+        "file": path.group(0) if path else None,
+    }
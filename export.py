@@ -0,0 +1,244 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from metrics import counter, log_event
+from resilience import RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRYABLE_CODES
+from store import ADDED_COLUMNS, get_store
+
+# Export settings (overridable through the environment)
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "1000"))
+# NDJSON HTTP sink that results are pushed to, such as a Cribl HTTP source
+EXPORT_HTTP_URL = os.environ.get("EXPORT_HTTP_URL")
+# Sent as the Authorization header as is, e.g. "Bearer <token>" or "Splunk <token>"
+EXPORT_HTTP_AUTH = os.environ.get("EXPORT_HTTP_AUTH")
+EXPORT_HTTP_TIMEOUT = float(os.environ.get("EXPORT_HTTP_TIMEOUT", "30"))
+PUSH_ATTEMPTS = 3
+
+# Media type and file extension of each format
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+BASE_EXPORT_COLUMNS = ["analysis_id", "timestamp", "status", "threat_level"]
+ARROW_TYPES = {"TEXT": "string", "REAL": "float64", "INTEGER": "int64"}
+EVENT_SOURCETYPE = "criblbot:analysis"
+
+EXPORTED = counter("criblbot_exported_records_total", "Analysis records exported or pushed, by format")
+
+
+class ExportError(ValueError):
+    """Raised for an export that cannot be produced or delivered"""
+
+
+# Function to list the exported columns
+def export_columns(include_prompt=False):
+    """Typed fields first, then the response and, on request, the full prompt"""
+    return BASE_EXPORT_COLUMNS + list(ADDED_COLUMNS) + ["response"] + (["prompt"] if include_prompt else [])
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_ndjson(records, batch_rows=EXPORT_BATCH_ROWS):
+    """One JSON object per line, yielded batch_rows lines at a time"""
+    for batch in _batches(records, batch_rows):
+        yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+        EXPORTED.inc(len(batch), format="ndjson")
+
+
+def iter_csv(records, columns, batch_rows=EXPORT_BATCH_ROWS):
+    """Header row, then batch_rows rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for batch in _batches(records, batch_rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        EXPORTED.inc(len(batch), format="csv")
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands what was written to the caller in pieces"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def iter_parquet(records, columns, batch_rows=EXPORT_BATCH_ROWS):
+    """One Parquet row group per batch_rows records, yielded as each is written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, ARROW_TYPES[ADDED_COLUMNS.get(column, "TEXT")]) for column in columns])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in _batches(records, batch_rows):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+            EXPORTED.inc(len(batch), format="parquet")
+    yield sink.drain()
+
+
+# Function to stream the results matching a filter in one format
+def export_results(export_format="ndjson", include_prompt=False, batch_rows=EXPORT_BATCH_ROWS, **filters):
+    """Return an iterator of encoded chunks, raising ExportError before any is produced
+
+    filters are the store's status, threat_level, since and until.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"unknown export format: {export_format} (expected one of {', '.join(EXPORT_FORMATS)})")
+    columns = export_columns(include_prompt)
+    records = get_store().iter_records(columns, batch_size=batch_rows, **filters)
+    if export_format == "ndjson":
+        return iter_ndjson(records, batch_rows)
+    if export_format == "csv":
+        return iter_csv(records, columns, batch_rows)
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ExportError("Parquet export needs the pyarrow package") from None
+    return iter_parquet(records, columns, batch_rows)
+
+
+# Function to write an export to a temporary file
+def export_to_file(export_format="ndjson", include_prompt=False, batch_rows=EXPORT_BATCH_ROWS, **filters):
+    """Write the export chunk by chunk to an anonymous temporary file and return it rewound
+
+    The file is deleted once it is closed.
+    """
+    chunks = export_results(export_format, include_prompt, batch_rows, **filters)
+    handle = tempfile.TemporaryFile()
+    try:
+        for chunk in chunks:
+            handle.write(chunk)
+    except BaseException:
+        handle.close()
+        raise
+    handle.seek(0)
+    return handle
+
+
+# Function to shape a record as a SIEM event
+def to_event(record):
+    """Record with Cribl's _time (epoch seconds), source and sourcetype added"""
+    event = dict(record)
+    event["_time"] = datetime.strptime(record["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+    event["source"] = "criblbot"
+    event["sourcetype"] = EVENT_SOURCETYPE
+    return event
+
+
+def _post(url, body, auth, timeout):
+    headers = {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+    if auth:
+        headers["Authorization"] = auth
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    for attempt in range(1, PUSH_ATTEMPTS + 1):
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+            return
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRYABLE_CODES or attempt == PUSH_ATTEMPTS:
+                raise ExportError(f"sink answered {e.code} {e.reason}") from None
+        except (urllib.error.URLError, OSError) as e:
+            if attempt == PUSH_ATTEMPTS:
+                raise ExportError(f"sink unreachable: {e}") from None
+        time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))))
+
+
+# Function to push the results matching a filter to an HTTP sink
+def push_results(url=EXPORT_HTTP_URL, auth=EXPORT_HTTP_AUTH, include_prompt=False, batch_rows=EXPORT_BATCH_ROWS,
+                 timeout=EXPORT_HTTP_TIMEOUT, **filters):
+    """POST matching results as gzipped NDJSON events, batch_rows per request
+
+    Returns the number of events pushed. Retryable sink errors are retried
+    with jittered backoff; anything else raises ExportError, leaving earlier
+    batches delivered.
+    """
+    if not url:
+        raise ExportError("no export sink configured (set EXPORT_HTTP_URL)")
+    records = get_store().iter_records(export_columns(include_prompt), batch_size=batch_rows, **filters)
+    pushed = 0
+    for batch in _batches(records, batch_rows):
+        body = "".join(json.dumps(to_event(record), ensure_ascii=False) + "\n" for record in batch)
+        _post(url, gzip.compress(body.encode("utf-8")), auth, timeout)
+        pushed += len(batch)
+        EXPORTED.inc(len(batch), format="http")
+    log_event("export_push", url=url, events=pushed, **{key: value for key, value in filters.items() if value})
+    return pushed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored analyses to a file or push them to an HTTP sink")
+    parser.add_argument("--format", default="ndjson", choices=list(EXPORT_FORMATS), help="file format")
+    parser.add_argument("--since", help="earliest timestamp, e.g. 2024-05-01")
+    parser.add_argument("--until", help="timestamp to stop before, e.g. 2024-05-08")
+    parser.add_argument("--status", help="only analyses with this status")
+    parser.add_argument("--threat-level", help="only analyses with this threat level")
+    parser.add_argument("--include-prompt", action="store_true", help="also export each analyzed log batch")
+    parser.add_argument("--output", help="file to write (default stdout)")
+    parser.add_argument("--push", nargs="?", const=EXPORT_HTTP_URL or "", help="push to this NDJSON HTTP sink instead (default EXPORT_HTTP_URL)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    filters = {"status": args.status, "threat_level": args.threat_level, "since": args.since, "until": args.until}
+    try:
+        if args.push is not None:
+            pushed = push_results(args.push, include_prompt=args.include_prompt, **filters)
+            print(f"Pushed {pushed} analyses to {args.push}", file=sys.stderr)
+            return 0
+        chunks = export_results(args.format, args.include_prompt, **filters)
+        if not args.output:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            return 0
+        with open(args.output, "wb") as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+    except ExportError as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
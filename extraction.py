@@ -0,0 +1,94 @@
+import json
+import re
+from enum import Enum
+from typing import List
+
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel, Field, ValidationError
+
+from metrics import log_event
+
+
+class ThreatLevel(str, Enum):
+    LOW = "LOW"
+    MEDIUM = "MEDIUM"
+    HIGH = "HIGH"
+    CRITICAL = "CRITICAL"
+
+
+THREAT_LEVELS = [level.value for level in ThreatLevel]
+
+
+class ThreatAssessment(BaseModel):
+    """Typed fields of a response in the STRUCTURED RESPONSE FORMAT"""
+
+    threat_level: ThreatLevel = Field(description="Overall threat level")
+    risk_score: int = Field(ge=1, le=10, description="Risk score from 1 to 10")
+    key_findings: str = Field(description="Brief summary of the key findings")
+    immediate_actions: List[str] = Field(description="Critical next steps, one per item")
+
+
+# Headings of the structured response format, used to find section boundaries
+SECTION_HEADINGS = r"THREAT LEVEL|RISK SCORE|KEY FINDINGS|IMMEDIATE ACTIONS|RECOMMENDATIONS|PREDICTIVE ANALYSIS|PRESCRIPTIVE ANALYSIS"
+THREAT_LEVEL_RE = re.compile(r"THREAT LEVEL\W*(LOW|MEDIUM|HIGH|CRITICAL)", re.IGNORECASE)
+RISK_SCORE_RE = re.compile(r"RISK SCORE\W*(\d{1,2})(?:\.\d+)?(?:\s*/\s*10)?", re.IGNORECASE)
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def _section(text, heading):
+    match = re.search(
+        rf"{heading}\W*?[:\n](.*?)(?=^\W*(?:{SECTION_HEADINGS})\b|\Z)",
+        text,
+        re.IGNORECASE | re.DOTALL | re.MULTILINE
+    )
+    return match.group(1).strip(" *\n") if match else ""
+
+
+# Function to parse the structured fields out of a markdown response
+def parse_assessment(text):
+    """Tolerantly pull threat level, risk score, findings and actions from response text"""
+    level = THREAT_LEVEL_RE.search(text)
+    score = RISK_SCORE_RE.search(text)
+    actions = [
+        BULLET_RE.sub("", line).strip(" *")
+        for line in _section(text, "IMMEDIATE ACTIONS").splitlines()
+    ]
+    return {
+        "threat_level": level.group(1).upper() if level else None,
+        "risk_score": min(max(int(score.group(1)), 1), 10) if score else None,
+        "findings": _section(text, "KEY FINDINGS") or None,
+        "actions": [action for action in actions if action],
+    }
+
+
+# Function to extract typed fields once, at store time
+def extract_assessment(text, llm=None):
+    """Return the typed assessment fields for a response
+
+    The regex parser handles responses that follow the format for free; only
+    when it can't find a threat level or risk score is llm asked to fill the
+    ThreatAssessment schema through schema-constrained output. Output that
+    doesn't fit the schema falls back to the regex fields; errors calling the
+    model are raised.
+    """
+    fields = parse_assessment(text)
+    if llm is not None and (fields["threat_level"] is None or fields["risk_score"] is None):
+        try:
+            assessment = llm.with_structured_output(ThreatAssessment).invoke(
+                "Extract the threat assessment from this security analysis:\n\n" + text
+            )
+        except (OutputParserException, ValidationError) as e:
+            log_event("assessment_fallback", reason=type(e).__name__, error=str(e)[:200])
+        else:
+            if assessment is None:
+                log_event("assessment_fallback", reason="no structured output")
+            else:
+                fields = {
+                    "threat_level": assessment.threat_level.value,
+                    "risk_score": assessment.risk_score,
+                    "findings": assessment.key_findings,
+                    "actions": assessment.immediate_actions,
+                }
+
+    fields["actions"] = json.dumps(fields["actions"]) if fields["actions"] else None
+    return fields
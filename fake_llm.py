@@ -0,0 +1,97 @@
+import hashlib
+import random
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_LEVELS = ["LOW", "LOW", "MEDIUM", "HIGH", "CRITICAL"]
+
+FAKE_RESPONSE = """🚨 *THREAT LEVEL*: {level}
+📊 *RISK SCORE*: {score}
+🔍 *KEY FINDINGS*: Synthetic analysis {digest} of {lines} log lines.
+⚡ *IMMEDIATE ACTIONS*:
+- Review the activity of the accounts in batch {digest}
+🛡 *RECOMMENDATIONS*: Continue monitoring."""
+
+
+# Function to build the deterministic response for a prompt
+def fake_response(prompt_text):
+    """Same prompt, same response: level and score are derived from its hash"""
+    digest = hashlib.sha256(prompt_text.encode()).hexdigest()
+    level_index = int(digest[:8], 16) % len(FAKE_LEVELS)
+    return FAKE_RESPONSE.format(
+        level=FAKE_LEVELS[level_index],
+        score=min(10, 2 * level_index + 1 + int(digest[8], 16) % 2),
+        digest=digest[:8],
+        lines=prompt_text.count("\n") + 1,
+    )
+
+
+# Function to answer a combined prompt the way coalesce.py expects
+def fake_combined_response(prompt_text):
+    """One deterministic report per BATCH section, or None for an ordinary prompt"""
+    from coalesce import split_sections
+    sections = split_sections(prompt_text)
+    if not sections:
+        return None
+    return "\n\n".join(f"=== BATCH {number} ===\n{fake_response(section)}" for number, section in sorted(sections.items()))
+
+
+class FakeQuotaError(Exception):
+    """Stand-in for Gemini's 429 ResourceExhausted"""
+
+    code = 429
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatGoogleGenerativeAI with configurable latency
+
+    latency is the delay before the first token; tokens_per_second paces the
+    rest of a streamed response (0 streams it instantly). failure_rate of the
+    calls fail with a quota error before producing anything.
+    """
+
+    model_name: str = "fake"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    failure_rate: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _response_for(self, messages):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeQuotaError("429 Resource has been exhausted (e.g. check quota).")
+        prompt_text = str(messages[-1].content) if messages else ""
+        return fake_combined_response(prompt_text) or fake_response(prompt_text)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = self._response_for(messages)
+        time.sleep(self.latency + (len(text.split()) / self.tokens_per_second if self.tokens_per_second else 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for index, word in enumerate(self._response_for(messages).split(" ")):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if index == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_chunk_to_message, message_to_dict, messages_from_dict
+
+from memory import RollingSummaryMemory
+from metrics import gauge
+
+# History store settings (overridable through the environment)
+HISTORY_MAX_SESSIONS = int(os.environ.get("HISTORY_MAX_SESSIONS", "500"))
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "200"))
+# Persist transcripts here so evicted sessions and restarts can reload them
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH")
+HISTORY_MAX_DISK_SESSIONS = int(os.environ.get("HISTORY_MAX_DISK_SESSIONS", "10000"))
+PRUNE_INTERVAL = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions (updated_at);
+"""
+
+
+class SessionHistory(BaseChatMessageHistory):
+    """Transcript and rolling summary of one conversation, capped at max_messages"""
+
+    def __init__(self, session_id, store, messages=None, next_seq=None, max_messages=HISTORY_MAX_MESSAGES):
+        self.session_id = session_id
+        self.store = store
+        self.messages = messages or []
+        self.max_messages = max_messages
+        self.memory = RollingSummaryMemory()
+        # Sequence number of the next message on disk, which trimming doesn't reset
+        self._seq = len(self.messages) if next_seq is None else next_seq
+
+    def add_messages(self, messages):
+        # Streamed replies arrive as aggregated chunks; keep them as plain AI messages
+        messages = [message_chunk_to_message(message) for message in messages]
+        first_seq = self._seq
+        self.messages.extend(messages)
+        self._seq += len(messages)
+        overflow = len(self.messages) - self.max_messages
+        if overflow > 0:
+            # Oldest turns go first; the summary already covers what it folded in
+            del self.messages[:overflow]
+            self.memory.summarized_count = max(0, self.memory.summarized_count - overflow)
+        self.store.persist(self, messages, first_seq)
+
+    def clear(self):
+        self.messages = []
+        self._seq = 0
+        self.memory.clear()
+        self.store.persist(self, [], 0, replace=True)
+
+
+class HistoryStore:
+    """Keyed chat histories with LRU eviction, optionally backed by SQLite
+
+    Session IDs separate each browser session's chat from every webhook
+    analysis (webhook_<analysis ID>), so no conversation pays for another's
+    context. At most max_sessions histories are held in memory; with a disk
+    path, evicted ones are reloaded on their next use and the least recently
+    updated beyond max_disk_sessions are deleted.
+    """
+
+    def __init__(self, max_sessions=HISTORY_MAX_SESSIONS, max_messages=HISTORY_MAX_MESSAGES,
+                 path=HISTORY_DB_PATH, max_disk_sessions=HISTORY_MAX_DISK_SESSIONS):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.path = path
+        self.max_disk_sessions = max_disk_sessions
+        self.evictions = 0
+        self._writes = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        """History for session_id, loaded from disk or created on first use"""
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is not None:
+                self._sessions.move_to_end(session_id)
+                return history
+
+        messages, next_seq = self._load(session_id)
+        history = SessionHistory(session_id, self, messages, next_seq, self.max_messages)
+        with self._lock:
+            # Another thread may have loaded it meanwhile
+            history = self._sessions.setdefault(session_id, history)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return history
+
+    def persist(self, history, messages, first_seq, replace=False):
+        if not self.path:
+            return
+        with self._connect() as conn:
+            if replace:
+                conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (history.session_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO chat_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                [
+                    (history.session_id, seq, json.dumps(message_to_dict(message)))
+                    for seq, message in enumerate(messages, first_seq)
+                ]
+            )
+            # Keep the same cap on disk as in memory
+            conn.execute(
+                "DELETE FROM chat_messages WHERE session_id = ? AND seq < ?",
+                (history.session_id, history._seq - history.max_messages)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (session_id, updated_at) VALUES (?, ?)",
+                (history.session_id, time.time())
+            )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % PRUNE_INTERVAL == 0
+        if prune:
+            self._prune()
+
+    def _load(self, session_id):
+        if not self.path:
+            return [], 0
+        rows = self._connect().execute(
+            "SELECT seq, message FROM chat_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        messages = [message_chunk_to_message(message) for message in messages_from_dict([json.loads(row[1]) for row in rows])]
+        return messages, rows[-1][0] + 1 if rows else 0
+
+    def _prune(self):
+        # Drop the least recently updated sessions over the disk cap
+        with self._connect() as conn:
+            stale = [
+                row[0] for row in conn.execute(
+                    "SELECT session_id FROM chat_sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                    (self.max_disk_sessions,)
+                )
+            ]
+            conn.executemany("DELETE FROM chat_messages WHERE session_id = ?", [(session_id,) for session_id in stale])
+            conn.executemany("DELETE FROM chat_sessions WHERE session_id = ?", [(session_id,) for session_id in stale])
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "evictions": self.evictions}
+
+
+# Shared store so histories outlive page reruns and are reachable by session ID
+@lru_cache(maxsize=None)
+def get_history_store():
+    store = HistoryStore()
+    gauge("criblbot_history_sessions", "Chat histories held in memory", lambda: [({}, store.stats()["sessions"])])
+    return store
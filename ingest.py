@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from analysis import extract_analysis_id, get_webhook_hash
+from dedup import get_dedup_service
+from export import EXPORT_FORMATS, ExportError, export_results, push_results
+from jobs import QueueFull, get_job_queue
+from metrics import REGISTRY, timed
+from payload import PayloadDecoder, PayloadError, PayloadTooLarge
+
+# Ingest server settings (overridable through the environment)
+INGEST_HOST = os.environ.get("INGEST_HOST", "0.0.0.0")
+INGEST_PORT = int(os.environ.get("INGEST_PORT", "8502"))
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN")
+
+
+# Function to split a Cribl payload into individual events
+def parse_events(body):
+    """Parse a JSON array, JSON object or NDJSON payload into a list of events"""
+    text = body.decode("utf-8", errors="replace").strip()
+    if not text:
+        return []
+
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        payload = None
+    else:
+        return payload if isinstance(payload, list) else [payload]
+
+    events = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            events.append(line)
+    return events
+
+
+# Function to turn parsed events into the log text sent for analysis
+def format_batch(events):
+    """Render one log line per event, preferring Cribl's _raw field"""
+    lines = []
+    for event in events:
+        if isinstance(event, dict) and "_raw" in event:
+            lines.append(str(event["_raw"]))
+        elif isinstance(event, str):
+            lines.append(event)
+        else:
+            lines.append(json.dumps(event, separators=(",", ":"), default=str))
+    return "\n".join(lines)
+
+
+# Function to read a request body, decompressing it as it arrives
+async def read_body(request):
+    """Decoded body of a plain, gzip or zstd request, raw or base64 encoded"""
+    decoder = PayloadDecoder(request.headers.get("content-encoding"))
+    parts = []
+    async for chunk in request.stream():
+        parts.append(decoder.feed(chunk))
+    parts.append(decoder.finish())
+    return b"".join(parts)
+
+
+# Function to check the bearer token when one is configured
+def authorized(request):
+    return not INGEST_TOKEN or request.headers.get("authorization") == f"Bearer {INGEST_TOKEN}"
+
+
+# Function to refuse export requests without the bearer token
+def export_denied(request):
+    """Error response for an export request, or None when it may proceed
+
+    Exports hand out every stored analysis, so unlike ingest they are only
+    served once INGEST_TOKEN is set.
+    """
+    if not INGEST_TOKEN:
+        return JSONResponse({"error": "export is disabled until INGEST_TOKEN is set"}, status_code=403)
+    if not authorized(request):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return None
+
+
+# Function to read the export filters of a request
+def export_filters(query_params):
+    """status, threat_level, since and until query parameters, unset when empty"""
+    return {name: query_params.get(name) or None for name in ("status", "threat_level", "since", "until")}
+
+
+async def ingest(request):
+    """Accept a batch of Cribl events and queue it for analysis"""
+    if not authorized(request):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+
+    try:
+        with timed("ingest_decode"):
+            body = await read_body(request)
+    except PayloadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except PayloadError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    # Parsing, the SQLite duplicate claim and the queued record all block, so they run off the event loop
+    return await run_in_threadpool(accept_batch, body, request.query_params.get("analysis_id"))
+
+
+# Function to parse, claim and queue a decoded ingest body
+def accept_batch(body, analysis_id=None):
+    """Return the response for a decoded batch: queued, duplicate, empty or queue full"""
+    with timed("ingest_parse"):
+        events = parse_events(body)
+        log_text = format_batch(events)
+    if not events:
+        return JSONResponse({"error": "empty payload"}, status_code=400)
+
+    webhook_hash = get_webhook_hash(log_text)
+    analysis_id = analysis_id or extract_analysis_id(log_text) or f"auto_{webhook_hash}"
+
+    # Resends of a batch already accepted by any replica are acknowledged, not re-analyzed
+    dedup = get_dedup_service()
+    if not dedup.claim(webhook_hash):
+        return JSONResponse({"status": "duplicate", "analysis_id": analysis_id, "events": len(events)})
+
+    try:
+        job = get_job_queue().submit(analysis_id, log_text, dedup_key=webhook_hash)
+    except QueueFull:
+        # Let Cribl back off and retry instead of dropping the batch
+        dedup.release(webhook_hash)
+        return JSONResponse({"error": "analysis queue full"}, status_code=503, headers={"Retry-After": "5"})
+    except Exception:
+        # A batch that was never queued must not be answered as a duplicate when Cribl retries it
+        dedup.release(webhook_hash)
+        raise
+
+    return JSONResponse(
+        {"status": job.status, "job_id": job.job_id, "analysis_id": analysis_id, "events": len(events)},
+        status_code=202
+    )
+
+
+async def export(request):
+    """Stream the analyses matching the query's filters as NDJSON, CSV or Parquet"""
+    denied = export_denied(request)
+    if denied:
+        return denied
+    export_format = request.query_params.get("format", "ndjson")
+    include_prompt = request.query_params.get("include_prompt") in ("1", "true")
+    try:
+        chunks = export_results(export_format, include_prompt, **export_filters(request.query_params))
+    except ExportError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    media_type, extension = EXPORT_FORMATS[export_format]
+    file_name = f"analyses_{time.strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
+
+async def export_push(request):
+    """Push the analyses matching the query's filters to the configured HTTP sink"""
+    denied = export_denied(request)
+    if denied:
+        return denied
+    include_prompt = request.query_params.get("include_prompt") in ("1", "true")
+    try:
+        pushed = await run_in_threadpool(
+            push_results, include_prompt=include_prompt, **export_filters(request.query_params)
+        )
+    except ExportError as e:
+        return JSONResponse({"error": str(e)}, status_code=502)
+    return JSONResponse({"status": "pushed", "events": pushed})
+
+
+async def job_status(request):
+    job = get_job_queue().get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "queue": get_job_queue().depth()})
+
+
+async def metrics(request):
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def metrics_json(request):
+    return JSONResponse(REGISTRY.snapshot())
+
+
+app = Starlette(routes=[
+    Route("/ingest", ingest, methods=["POST"]),
+    Route("/jobs/{job_id}", job_status, methods=["GET"]),
+    Route("/export", export, methods=["GET"]),
+    Route("/export/push", export_push, methods=["POST"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+    Route("/metrics.json", metrics_json, methods=["GET"]),
+])
+
+
+# Function to run the ingest app beside the Streamlit server
+def start_ingest_server(host=INGEST_HOST, port=INGEST_PORT):
+    """Serve the ingest app from a daemon thread and return the server"""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    # Signal handlers can only be installed from the main thread
+    server.install_signal_handlers = lambda: None
+    threading.Thread(target=server.run, name="cribl-ingest", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=INGEST_HOST, port=INGEST_PORT)
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from analysis import DEFAULT_MODEL, analyze_coalesced, analyze_prepared, prepare_log_batch, store_analysis_result
+from coalesce import COALESCE_MAX_BATCHES, COALESCE_WINDOW, Coalescer
+from dedup import get_dedup_service
+from metrics import PHASE_SECONDS, gauge, log_event, timed
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+ERROR = "error"
+
+# Worker pool settings (overridable through the environment)
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "4"))
+ANALYSIS_MAX_PENDING = int(os.environ.get("ANALYSIS_MAX_PENDING", "1000"))
+JOB_HISTORY_LIMIT = 10000
+
+
+class QueueFull(Exception):
+    """Raised when the analysis queue cannot accept more jobs"""
+
+
+class Job:
+    """A single log batch analysis and its current state"""
+
+    def __init__(self, analysis_id, log_text, model_name, dedup_key=None):
+        self.job_id = uuid.uuid4().hex
+        self.analysis_id = analysis_id
+        self.log_text = log_text
+        self.model_name = model_name
+        self.dedup_key = dedup_key
+        self.batch = None
+        self.status = QUEUED
+        self.result = None
+        self.partial = []
+        self.details = {}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def partial_text(self):
+        """Response text streamed so far"""
+        return "".join(self.partial)
+
+    def release_batch(self):
+        """Drop the batch text once it is stored, so finished jobs hold only their result"""
+        self.log_text = None
+        self.batch = None
+        self.partial = []
+
+    def wait(self, timeout=None):
+        """Block until the job finishes, returning False on timeout"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "analysis_id": self.analysis_id,
+            "model": self.model_name,
+            "status": self.status,
+            "details": self.details,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Bounded thread pool that runs analyses independently of page reruns
+
+    With a coalesce window, small batches that still need the model after
+    the cache and triage wait briefly so that several can share a model
+    call. Everything else, including the follow-up work of a shared call,
+    runs as its own task.
+    """
+
+    def __init__(self, max_workers=ANALYSIS_WORKERS, max_pending=ANALYSIS_MAX_PENDING,
+                 coalesce_window=COALESCE_WINDOW, coalesce_max_batches=COALESCE_MAX_BATCHES):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._coalescer = None
+        if coalesce_window > 0 and coalesce_max_batches > 1:
+            self._coalescer = Coalescer(
+                lambda jobs: self._executor.submit(self._run_group, jobs),
+                coalesce_window,
+                coalesce_max_batches
+            )
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, analysis_id, log_text, model_name=DEFAULT_MODEL, dedup_key=None):
+        """Queue a log batch for analysis, raising QueueFull when saturated
+
+        dedup_key is the batch's duplicate claim, released if the analysis
+        fails so that a resend is analyzed again.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("analysis queue is full")
+
+        job = Job(analysis_id, log_text, model_name, dedup_key)
+        try:
+            self._record(job)
+        except Exception:
+            # The job never started, so its slot is free again
+            self._slots.release()
+            raise
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._trim()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        """Count tracked jobs by state"""
+        counts = {QUEUED: 0, RUNNING: 0, COMPLETED: 0, ERROR: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        PHASE_SECONDS.observe(job.started_at - job.created_at, phase="queue_wait")
+        try:
+            self._record(job)
+            with timed("job_run"):
+                job.batch = prepare_log_batch(job.analysis_id, job.log_text, job.model_name, on_token=job.partial.append)
+                if self._coalescer is not None and job.batch.coalescable:
+                    # Only small batches wait for others to share their model call
+                    self._coalescer.add(job)
+                    return
+                if job.batch.content is None:
+                    analyze_prepared(job.batch)
+        except Exception as e:
+            self._settle(job, e)
+            return
+        self._settle(job)
+
+    def _run_group(self, jobs):
+        try:
+            with timed("job_group_run"):
+                pending, errors = analyze_coalesced([job.batch for job in jobs])
+        except Exception as e:
+            pending, errors = [], dict.fromkeys(range(len(jobs)), e)
+        for index, job in enumerate(jobs):
+            if index in errors:
+                self._settle(job, errors[index])
+            elif index in pending:
+                # Batches analyzed alone and escalations run in parallel, not one after another here
+                self._executor.submit(self._run_prepared, job)
+            else:
+                self._settle(job)
+
+    def _run_prepared(self, job):
+        try:
+            with timed("job_run"):
+                analyze_prepared(job.batch)
+        except Exception as e:
+            self._settle(job, e)
+            return
+        self._settle(job)
+
+    def _settle(self, job, error=None):
+        if error is None:
+            job.result, job.details = job.batch.content, job.batch.details
+            job.status = COMPLETED
+        else:
+            job.error = str(error)
+            job.status = ERROR
+        job.finished_at = time.time()
+        try:
+            self._record(job)
+        except Exception as e:
+            # An unrecordable result must not leave the job unfinished
+            log_event("job_record_failed", job_id=job.job_id, error=str(e)[:200])
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        try:
+            if job.status == ERROR and job.dedup_key:
+                # A failed analysis must not suppress the resend that would retry it
+                get_dedup_service().release(job.dedup_key)
+        except Exception as e:
+            log_event("dedup_release_failed", job_id=job.job_id, error=str(e)[:200])
+        finally:
+            job.release_batch()
+            job._done.set()
+            self._slots.release()
+
+    def _record(self, job):
+        if job.status == ERROR:
+            response = f"Error: {job.error}"
+        else:
+            response = job.result or ""
+        # The prompt is written once, when the job is queued
+        store_analysis_result(
+            job.analysis_id, job.log_text, response, job.status, prompt_stored=job.status != QUEUED, **job.details
+        )
+
+    def _trim(self):
+        # Forget the oldest finished jobs once the history limit is reached
+        while len(self._jobs) > JOB_HISTORY_LIMIT:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if not oldest.done:
+                break
+            del self._jobs[oldest_id]
+
+
+# Shared queue used by the Streamlit sessions and the ingest server
+@lru_cache(maxsize=None)
+def get_job_queue():
+    queue = JobQueue()
+    gauge(
+        "criblbot_queue_jobs",
+        "Tracked analysis jobs by state",
+        lambda: [({"state": state}, count) for state, count in queue.depth().items()]
+    )
+    return queue
@@ -0,0 +1,162 @@
+import re
+import threading
+
+from tokens import estimate_tokens
+
+# Variable fields masked before lines are clustered, most specific first
+VARIABLE_PATTERNS = [
+    re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"),
+    re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+    re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"),
+    re.compile(r"\b(?:[0-9a-fA-F]{1,4}:){2,7}[0-9a-fA-F]{1,4}\b"),
+    re.compile(r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{16,}\b"),
+    re.compile(r"\b\d+(?:\.\d+)?\b"),
+]
+WILDCARD = "<*>"
+TOKEN_RE = re.compile(r"<\*>|[\w.\-/@]+|\S")
+
+# Batches shorter than this are sent verbatim
+MIN_LINES_TO_COMPACT = 20
+
+
+# Function to replace variable fields in a log line with wildcards
+def mask_line(line):
+    """Return the masked line and the values that were masked out"""
+    values = []
+
+    def replace(match):
+        values.append(match.group(0))
+        return WILDCARD
+
+    for pattern in VARIABLE_PATTERNS:
+        line = pattern.sub(replace, line)
+    return line, values
+
+
+class LogCluster:
+    """Lines sharing one template, with a few example variable values"""
+
+    def __init__(self, tokens, spacing, raw_line, values):
+        self.tokens = tokens
+        self.spacing = spacing
+        self.count = 1
+        self.raw_lines = [raw_line]
+        self.examples = [values] if values else []
+
+    def similarity(self, tokens):
+        matches = sum(1 for a, b in zip(self.tokens, tokens) if a == b or a == WILDCARD)
+        return matches / len(tokens)
+
+    def add(self, tokens, raw_line, values, keep_raw, max_examples):
+        # Tokens that differ from the template become variables too
+        values = values + [b for a, b in zip(self.tokens, tokens) if a != b and b != WILDCARD]
+        self.tokens = [a if a == b else WILDCARD for a, b in zip(self.tokens, tokens)]
+        self.count += 1
+        if len(self.raw_lines) < keep_raw:
+            self.raw_lines.append(raw_line)
+        if values and len(self.examples) < max_examples:
+            self.examples.append(values)
+
+    @property
+    def template(self):
+        return "".join(space + token for space, token in zip(self.spacing, self.tokens)).strip()
+
+
+class LogTemplateMiner:
+    """Drain-style online clustering of log lines into templates
+
+    Lines are grouped by token count and leading token, then merged into the
+    most similar existing cluster when enough positions agree.
+    """
+
+    def __init__(self, similarity_threshold=0.6, min_repeats=3, max_examples=3):
+        self.similarity_threshold = similarity_threshold
+        self.min_repeats = min_repeats
+        self.max_examples = max_examples
+        self.clusters = []
+        self._groups = {}
+
+    def add_line(self, line):
+        masked, values = mask_line(line)
+        matches = list(TOKEN_RE.finditer(masked))
+        if not matches:
+            return None
+        tokens = [match.group(0) for match in matches]
+
+        group = self._groups.setdefault((len(tokens), tokens[0]), [])
+        best, best_score = None, 0.0
+        for cluster in group:
+            score = cluster.similarity(tokens)
+            if score > best_score:
+                best, best_score = cluster, score
+
+        if best is not None and best_score >= self.similarity_threshold:
+            best.add(tokens, line, values, self.min_repeats, self.max_examples)
+            return best
+
+        spacing = [" " if match.start() and masked[match.start() - 1].isspace() else "" for match in matches]
+        cluster = LogCluster(tokens, spacing, line, values)
+        group.append(cluster)
+        self.clusters.append(cluster)
+        return cluster
+
+    def summary_lines(self):
+        """Collapse repeated templates into counts and keep rare lines verbatim"""
+        lines = []
+        for cluster in self.clusters:
+            if cluster.count < self.min_repeats:
+                lines.extend(cluster.raw_lines)
+                continue
+            line = f"[x{cluster.count}] {cluster.template}"
+            if cluster.examples:
+                examples = "; ".join(", ".join(values[:4]) for values in cluster.examples)
+                line += f"  (e.g. {examples})"
+            lines.append(line)
+        return lines
+
+
+class CompactBatch:
+    """A log batch rewritten for the prompt, with its token reduction"""
+
+    def __init__(self, text, original_tokens, compact_tokens, templates):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.compact_tokens = compact_tokens
+        self.templates = templates
+
+    @property
+    def reduction_ratio(self):
+        return self.original_tokens / self.compact_tokens if self.compact_tokens else 1.0
+
+
+# Running totals across every compacted batch
+mining_stats = {"batches": 0, "original_tokens": 0, "compact_tokens": 0}
+_stats_lock = threading.Lock()
+
+COMPACT_HEADER = (
+    "[Log batch compacted: repeated lines are shown once as templates prefixed "
+    "with [xN] occurrences, <*> marks varying fields, rare lines are verbatim]"
+)
+
+
+# Function to compact a log batch before prompting
+def compact_log_batch(log_text, similarity_threshold=0.6, min_repeats=3):
+    """Return a CompactBatch, falling back to the original text when it doesn't shrink"""
+    lines = [line for line in log_text.splitlines() if line.strip()]
+    original_tokens = estimate_tokens(log_text)
+
+    compact = CompactBatch(log_text, original_tokens, original_tokens, len(lines))
+    if len(lines) >= MIN_LINES_TO_COMPACT:
+        miner = LogTemplateMiner(similarity_threshold, min_repeats)
+        for line in lines:
+            miner.add_line(line)
+        text = COMPACT_HEADER + "\n" + "\n".join(miner.summary_lines())
+        compact_tokens = estimate_tokens(text)
+        if compact_tokens < original_tokens:
+            compact = CompactBatch(text, original_tokens, compact_tokens, len(miner.clusters))
+
+    with _stats_lock:
+        mining_stats["batches"] += 1
+        mining_stats["original_tokens"] += compact.original_tokens
+        mining_stats["compact_tokens"] += compact.compact_tokens
+    return compact
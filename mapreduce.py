@@ -0,0 +1,127 @@
+import os
+
+from metrics import log_event
+from prompts import prompt_template, reduce_prompt_template
+from tokens import CHARS_PER_TOKEN, estimate_tokens
+
+# Largest prompt body sent in one call, and how many chunk calls run at once
+CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", "100000"))
+MAP_CONCURRENCY = int(os.environ.get("MAP_CONCURRENCY", "8"))
+# Rounds of group merges before the remaining partials are cut down to fit one final merge
+MAX_REDUCE_ROUNDS = int(os.environ.get("MAX_REDUCE_ROUNDS", "4"))
+# Room for a partial's header and truncation marker
+PARTIAL_OVERHEAD_TOKENS = 16
+TRUNCATION_MARKER = "\n[... truncated ...]"
+
+
+# Function to split a log batch into chunks that fit a token budget
+def split_into_chunks(text, token_budget=CHUNK_TOKEN_BUDGET):
+    """Pack whole lines into chunks of at most token_budget tokens
+
+    Lines longer than the budget on their own are cut into budget-sized pieces.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    chunks, current, current_tokens = [], [], 0
+    for line in text.splitlines():
+        pieces = [line[i:i + max_chars] for i in range(0, len(line), max_chars)] or [""]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece) + 1
+            if current and current_tokens + piece_tokens > token_budget:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# Function to collect a streamed response while forwarding its tokens
+def stream_content(chunks, on_token):
+    """Join streamed message chunks, passing each one's text to on_token"""
+    parts = []
+    for chunk in chunks:
+        if chunk.content:
+            parts.append(chunk.content)
+            on_token(chunk.content)
+    return "".join(parts)
+
+
+# Function to render a partial report for a reduce prompt
+def format_partial(number, partial, token_limit):
+    """Number the partial, cutting it to about token_limit tokens"""
+    max_chars = max(1, token_limit) * CHARS_PER_TOKEN
+    if len(partial) > max_chars:
+        partial = partial[:max_chars] + TRUNCATION_MARKER
+    return f"--- PARTIAL ANALYSIS {number} ---\n{partial}"
+
+
+# Function to pack partial reports into reduce groups
+def group_partials(partials, token_budget=CHUNK_TOKEN_BUDGET):
+    """Pack whole partials into groups of about token_budget tokens, at least two per group
+
+    Partials that fit the budget together form one group as they are.
+    Otherwise each is cut to half the budget so any two fit together, which
+    guarantees every reduce round leaves fewer partials than it started with.
+    """
+    whole = [format_partial(number, partial, len(partial)) for number, partial in enumerate(partials, 1)]
+    if sum(estimate_tokens(block) + 1 for block in whole) <= token_budget:
+        return ["\n".join(whole)]
+    token_limit = token_budget // 2 - PARTIAL_OVERHEAD_TOKENS
+    groups, current, current_tokens = [], [], 0
+    for number, partial in enumerate(partials, 1):
+        block = format_partial(number, partial, token_limit)
+        block_tokens = estimate_tokens(block) + 1
+        if len(current) >= 2 and current_tokens + block_tokens > token_budget:
+            groups.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += block_tokens
+    if current:
+        groups.append("\n".join(current))
+    return groups
+
+
+# Function to merge partial analyses into one report
+def reduce_partials(llm, partials, token_budget=CHUNK_TOKEN_BUDGET, max_concurrency=MAP_CONCURRENCY, on_token=None,
+                    max_rounds=MAX_REDUCE_ROUNDS):
+    """Merge partial reports, reducing in groups when they exceed the budget
+
+    After max_rounds group merges, whatever is left is cut to an equal share
+    of the budget each and merged in one call. The final merge is streamed
+    to on_token.
+    """
+    reduce_chain = reduce_prompt_template | llm
+    groups = group_partials(partials, token_budget)
+    rounds = 0
+    while len(groups) > 1:
+        if rounds == max_rounds:
+            log_event("reduce_rounds_exhausted", rounds=rounds, partials=len(partials))
+            token_limit = token_budget // len(partials) - PARTIAL_OVERHEAD_TOKENS
+            groups = ["\n".join(format_partial(number, partial, token_limit) for number, partial in enumerate(partials, 1))]
+            break
+        inputs = [{"chunk_count": len(partials), "partials": group} for group in groups]
+        merged = reduce_chain.batch(inputs, config={"max_concurrency": max_concurrency})
+        partials = [message.content for message in merged]
+        groups = group_partials(partials, token_budget)
+        rounds += 1
+    return stream_content(
+        reduce_chain.stream({"chunk_count": len(partials), "partials": groups[0]}),
+        on_token or (lambda token: None)
+    )
+
+
+# Function to analyze a batch that doesn't fit in one prompt
+def map_reduce_analyze(llm, log_text, token_budget=CHUNK_TOKEN_BUDGET, max_concurrency=MAP_CONCURRENCY, on_token=None):
+    """Analyze budget-sized chunks concurrently, then merge them into one report
+
+    Returns the merged response text and the number of chunks analyzed.
+    """
+    chunks = split_into_chunks(log_text, token_budget)
+    inputs = [
+        {"input": f"[Chunk {i} of {len(chunks)} of one log batch]\n{chunk}"}
+        for i, chunk in enumerate(chunks, 1)
+    ]
+    partials = (prompt_template | llm).batch(inputs, config={"max_concurrency": max_concurrency})
+    merged = reduce_partials(llm, [message.content for message in partials], token_budget, max_concurrency, on_token)
+    return merged, len(chunks)
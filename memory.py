@@ -0,0 +1,88 @@
+import os
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from prompts import summary_prompt_template
+from tokens import estimate_tokens
+
+# Tokens of conversation history sent with each chat turn
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "4000"))
+
+# Share of the budget the running summary may take
+SUMMARY_SHARE = 0.25
+
+# Characters of each evicted message passed to the summarizer
+SUMMARIZE_MESSAGE_CHARS = 4000
+
+
+# Function to count the tokens in a list of messages
+def messages_tokens(messages):
+    """Approximate token count of message contents"""
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+class RollingSummaryMemory:
+    """Keeps recent turns verbatim within a token budget and folds older ones into a summary
+
+    Summarization only runs when turns fall out of the budget, so most chat
+    turns cost no extra model call.
+    """
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary = ""
+        self.summarized_count = 0
+        self.last_sent_tokens = 0
+
+    def clear(self):
+        self.summary = ""
+        self.summarized_count = 0
+        self.last_sent_tokens = 0
+
+    def compact(self, messages, llm):
+        """Return the history to send: a summary exchange followed by recent turns"""
+        if len(messages) < self.summarized_count:
+            # The underlying history was cleared or replaced
+            self.clear()
+
+        recent = messages[self.summarized_count:]
+        keep_from = self._keep_from(recent)
+        if keep_from:
+            self._fold(recent[:keep_from], llm)
+            self.summarized_count += keep_from
+            recent = recent[keep_from:]
+
+        history = []
+        if self.summary:
+            # A user/assistant pair keeps the roles alternating for Gemini
+            history.append(HumanMessage(content=f"Summary of our earlier conversation:\n{self.summary}"))
+            history.append(AIMessage(content="Understood, I'll take that earlier context into account."))
+        history.extend(recent)
+        self.last_sent_tokens = messages_tokens(history)
+        return history
+
+    def _keep_from(self, recent):
+        # Walk back from the newest message while it fits next to the summary
+        budget = self.token_budget - estimate_tokens(self.summary)
+        keep_from, used = len(recent), 0
+        for index in range(len(recent) - 1, -1, -1):
+            used += estimate_tokens(str(recent[index].content))
+            if used > budget:
+                break
+            keep_from = index
+        # Never start the verbatim tail on an assistant reply
+        while keep_from < len(recent) and not isinstance(recent[keep_from], HumanMessage):
+            keep_from += 1
+        return keep_from
+
+    def _fold(self, evicted, llm):
+        turns = "\n\n".join(
+            f"{message.type.upper()}: {str(message.content)[:SUMMARIZE_MESSAGE_CHARS]}" for message in evicted
+        )
+        max_words = max(50, int(self.token_budget * SUMMARY_SHARE * 0.75))
+        response = (summary_prompt_template | llm).invoke({
+            "summary": self.summary or "(none yet)",
+            "turns": turns,
+            "max_words": max_words,
+        })
+        self.summary = response.content
@@ -0,0 +1,210 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from regex extraction up to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Every timing is also written as one JSON object per line when this is set
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH")
+
+logger = logging.getLogger("criblchatbot.metrics")
+if METRICS_LOG_PATH and not logger.handlers:
+    _handler = logging.FileHandler(METRICS_LOG_PATH)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.type_name = "counter"
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Gauge:
+    """Gauge read at scrape time from a callback returning (labels dict, value) pairs"""
+
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help_text = help_text
+        self.type_name = "gauge"
+        self._callback = callback
+
+    def _read(self):
+        try:
+            return list(self._callback())
+        except Exception:
+            return []
+
+    def samples(self):
+        return [(self.name, _label_key(labels), value) for labels, value in self._read()]
+
+    def snapshot(self):
+        return [{"labels": labels, "value": value} for labels, value in self._read()]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.type_name = "histogram"
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append((f"{self.name}_bucket", key + (("le", le),), cumulative))
+                samples.append((f"{self.name}_sum", key, series["sum"]))
+                samples.append((f"{self.name}_count", key, series["count"]))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    "labels": dict(key),
+                    "count": series["count"],
+                    "sum": series["sum"],
+                    "buckets": dict(zip([repr(b) for b in self.buckets] + ["+Inf"], series["counts"])),
+                }
+                for key, series in self._series.items()
+            ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text):
+    return REGISTRY.register(Counter(name, help_text))
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, buckets))
+
+
+def gauge(name, help_text, callback):
+    """Register a gauge; callback returns an iterable of (labels dict, value)"""
+    return REGISTRY.register(Gauge(name, help_text, callback))
+
+
+PHASE_SECONDS = histogram("criblbot_phase_seconds", "Latency of instrumented hot-path phases")
+LLM_TOKENS = counter("criblbot_llm_tokens_total", "Prompt and completion tokens sent to or received from the model")
+CACHE_LOOKUPS = counter("criblbot_response_cache_lookups_total", "Response cache lookups by result")
+ANALYSES = counter("criblbot_analyses_total", "Stored analysis results by status")
+
+
+# Function to log one structured metrics event
+def log_event(event, **fields):
+    """Write a JSON line to the metrics log when it is configured"""
+    if logger.handlers:
+        logger.info(json.dumps({"ts": time.time(), "event": event, **fields}, default=str))
+
+
+# Context manager to time a phase
+@contextmanager
+def timed(phase, **labels):
+    """Record the duration of the enclosed block in the phase latency histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, phase=phase, **labels)
+        log_event("phase", phase=phase, seconds=round(elapsed, 6), **labels)
+
+
+# Decorator form of timed()
+def instrumented(phase):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Function to count model tokens
+def record_tokens(model_name, prompt_tokens, completion_tokens):
+    LLM_TOKENS.inc(prompt_tokens, model=model_name, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model_name, kind="completion")
+    log_event("tokens", model=model_name, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
@@ -0,0 +1,173 @@
+import base64
+import os
+import re
+import zlib
+
+# Largest decoded webhook payload accepted (overridable through the environment)
+PAYLOAD_MAX_BYTES = int(os.environ.get("PAYLOAD_MAX_BYTES", str(64 * 1024 * 1024)))
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# What base64 of a gzip or zstd stream starts with
+BASE64_PREFIXES = {b"H4sI": "gzip", b"KLUv": "zstd"}
+SNIFF_BYTES = 4
+
+WHITESPACE_RE = re.compile(rb"[\t\r\n]")
+# URL-safe alphabet to the standard one; a space is a "+" lost to form decoding
+BASE64_TRANSLATION = bytes.maketrans(b"-_ ", b"+/+")
+
+
+class PayloadError(ValueError):
+    """Raised for a payload that cannot be decoded or decodes past the size limit"""
+
+
+class PayloadTooLarge(PayloadError):
+    """Raised when a payload decodes to more than the size limit"""
+
+
+class PayloadDecoder:
+    """Incrementally decodes a gzip, deflate or zstd payload, optionally base64 encoded
+
+    encoding is the HTTP Content-Encoding ("gzip", "deflate", "zstd" or
+    "identity"). Without one, the first bytes decide: gzip and zstd magic
+    numbers, their base64 forms, or else plain text passed through as is.
+    Output is bounded by max_bytes as it is produced, so a small compressed
+    body cannot expand without limit.
+    """
+
+    def __init__(self, encoding=None, max_bytes=PAYLOAD_MAX_BYTES):
+        self.encoding = (encoding or "").strip().lower() or None
+        self.max_bytes = max_bytes
+        self.base64 = False
+        self.size = 0
+        self._started = False
+        self._head = b""
+        self._base64_rest = b""
+        self._inflater = None
+
+    def feed(self, data):
+        """Decode the next piece of the payload, returning the bytes it yields"""
+        if not self._started:
+            self._head += data
+            if len(self._head.lstrip()) < SNIFF_BYTES:
+                return b""
+            data, self._head = self._head, b""
+            self._start(data)
+            if self.base64:
+                data = data.lstrip()
+        if self.base64:
+            data = self._unbase64(data)
+        return self._inflate(data)
+
+    def finish(self):
+        """Decode whatever is buffered, raising PayloadError for a truncated payload"""
+        output = b""
+        if not self._started:
+            data, self._head = self._head, b""
+            self._start(data)
+            output = self.feed(data) if data else b""
+        if self.base64 and self._base64_rest:
+            rest, self._base64_rest = self._base64_rest, b""
+            output += self._inflate(self._decode_base64(rest + b"=" * (-len(rest) % 4)))
+        if self.encoding in ("gzip", "deflate"):
+            output += self._check(self._inflater.flush())
+            if not self._inflater.eof:
+                raise PayloadError(f"truncated {self.encoding} payload")
+        elif self.encoding == "zstd" and not self._inflater.eof:
+            raise PayloadError("truncated zstd payload")
+        return output
+
+    def _start(self, head):
+        self._started = True
+        if self.encoding is None:
+            head = head.lstrip()
+            if head.startswith(GZIP_MAGIC):
+                self.encoding = "gzip"
+            elif head.startswith(ZSTD_MAGIC):
+                self.encoding = "zstd"
+            elif head[:SNIFF_BYTES] in BASE64_PREFIXES:
+                self.encoding = BASE64_PREFIXES[head[:SNIFF_BYTES]]
+                self.base64 = True
+            else:
+                self.encoding = "identity"
+
+        if self.encoding in ("gzip", "x-gzip"):
+            self.encoding = "gzip"
+            self._inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        elif self.encoding == "deflate":
+            # Accepts zlib-wrapped and gzip streams alike
+            self._inflater = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        elif self.encoding == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise PayloadError("zstd payloads need the zstandard package") from None
+            self._inflater = zstandard.ZstdDecompressor().decompressobj()
+        elif self.encoding != "identity":
+            raise PayloadError(f"unsupported payload encoding: {self.encoding}")
+
+    def _unbase64(self, data):
+        # Decode whole 4-character groups now and keep the rest for the next piece
+        data = self._base64_rest + WHITESPACE_RE.sub(b"", data)
+        usable = len(data) - len(data) % 4
+        self._base64_rest = data[usable:]
+        return self._decode_base64(data[:usable])
+
+    def _decode_base64(self, data):
+        try:
+            return base64.b64decode(data.translate(BASE64_TRANSLATION), validate=True)
+        except ValueError as e:
+            raise PayloadError(f"invalid base64 payload: {e}") from None
+
+    def _inflate(self, data):
+        if not data:
+            return b""
+        if self.encoding == "identity":
+            return self._check(data)
+        if self.encoding == "zstd":
+            try:
+                return self._check(self._inflater.decompress(data))
+            except Exception as e:
+                raise PayloadError(f"invalid zstd payload: {e}") from None
+        try:
+            # Never inflate more than the limit allows
+            output = self._inflater.decompress(data, self.max_bytes - self.size + 1)
+        except zlib.error as e:
+            raise PayloadError(f"invalid {self.encoding} payload: {e}") from None
+        if self._inflater.unconsumed_tail:
+            raise PayloadTooLarge(f"payload decodes to more than {self.max_bytes} bytes")
+        return self._check(output)
+
+    def _check(self, output):
+        self.size += len(output)
+        if self.size > self.max_bytes:
+            raise PayloadTooLarge(f"payload decodes to more than {self.max_bytes} bytes")
+        return output
+
+
+# Function to decode a complete payload
+def decode_payload(data, encoding=None, max_bytes=PAYLOAD_MAX_BYTES, piece_size=64 * 1024):
+    """Decode bytes or text that may be gzip or zstd, raw or base64 encoded, in pieces"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    decoder = PayloadDecoder(encoding, max_bytes)
+    parts = [decoder.feed(data[i:i + piece_size]) for i in range(0, len(data), piece_size)]
+    parts.append(decoder.finish())
+    return b"".join(parts)
+
+
+# Function to decode a ?prompt= webhook parameter
+def decode_prompt(text, max_bytes=PAYLOAD_MAX_BYTES):
+    """Plain prompts are returned unchanged; base64 gzip or zstd ones are decoded to text
+
+    A prompt that only starts like one (e.g. "KLUv...") and fails to decode
+    is plain text. One that decodes past max_bytes still raises PayloadTooLarge.
+    """
+    if text.lstrip()[:SNIFF_BYTES].encode() not in BASE64_PREFIXES:
+        return text
+    try:
+        return decode_payload(text, max_bytes=max_bytes).decode("utf-8", errors="replace")
+    except PayloadTooLarge:
+        raise
+    except PayloadError:
+        return text
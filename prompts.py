@@ -0,0 +1,77 @@
+import hashlib
+
+from langchain_core.prompts import ChatPromptTemplate
+
+# Enhanced system prompt for log analysis
+system_prompt = """You are an expert cybersecurity analyst specializing in insider threat detection and log analysis.
+When analyzing logs, provide comprehensive analysis including:
+
+PREDICTIVE ANALYSIS:
+- Identify patterns that may indicate potential future security incidents
+- Assess risk levels (LOW/MEDIUM/HIGH/CRITICAL) based on observed behaviors
+- Predict likely attack vectors or escalation paths
+- Estimate probability of insider threat scenarios
+
+PRESCRIPTIVE ANALYSIS:
+- Recommend specific immediate actions to take
+- Suggest preventive measures and security controls
+- Provide step-by-step incident response procedures
+- Recommend monitoring and detection improvements
+- Suggest policy and process enhancements
+
+STRUCTURED RESPONSE FORMAT:
+🚨 *THREAT LEVEL*: [LOW/MEDIUM/HIGH/CRITICAL]
+📊 *RISK SCORE*: [1-10]
+🔍 *KEY FINDINGS*: Brief summary
+⚡ *IMMEDIATE ACTIONS*: Critical next steps
+🛡 *RECOMMENDATIONS*: Long-term improvements
+
+When the logs are preceded by BEHAVIORAL BASELINE DELTAS, those are precomputed deviations of each user and host from its own normal activity; weigh them as evidence.
+When they are preceded by SIMILAR PAST INCIDENTS, those are earlier analyses of comparable activity; say whether this batch continues or repeats them.
+
+Focus on behavioral indicators, technical monitoring, anomaly detection, and actionable security recommendations."""
+
+prompt_template = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    ("placeholder", "{history}"),
+    ("human", "{input}")
+])
+
+# Merges the partial analyses of a batch that was split into chunks
+reduce_prompt = """The log batch below was too large to analyze at once, so it was split into {chunk_count} consecutive chunks and each chunk was analyzed separately.
+Merge these partial analyses into ONE report for the whole batch using the STRUCTURED RESPONSE FORMAT.
+Use the highest threat level and risk score that the combined evidence supports, correlate findings that span chunks, and deduplicate actions and recommendations.
+
+{partials}"""
+
+reduce_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    ("human", reduce_prompt)
+])
+
+# Analyzes several small log batches in one call; coalesce.py splits the answer per batch
+combined_prompt = """The input below holds {count} separate log batches, each under its own "=== BATCH <n> (analysis <id>) ===" header.
+Analyze every batch independently, as if it were the only one; never carry findings from one batch into another.
+Answer with one report per batch, in order, each starting with the line "=== BATCH <n> ===" and followed by the STRUCTURED RESPONSE FORMAT.
+
+{input}"""
+
+combined_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    ("human", combined_prompt)
+])
+
+# Folds conversation turns that no longer fit the history budget into a summary
+summary_prompt_template = ChatPromptTemplate.from_messages([
+    ("system", "You maintain a compact running summary of a security analyst's conversation with an insider threat analysis assistant."),
+    ("human", """Current summary:
+{summary}
+
+Older conversation turns to fold into it:
+{turns}
+
+Return the updated summary in at most {max_words} words. Keep analysis IDs, threat levels, risk scores, implicated users, hosts and IPs, and any open actions; drop raw log lines.""")
+])
+
+# Changes whenever a prompt changes, invalidating cached responses
+SYSTEM_PROMPT_VERSION = hashlib.sha256((system_prompt + reduce_prompt + combined_prompt).encode()).hexdigest()[:16]
@@ -0,0 +1,297 @@
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from metrics import PHASE_SECONDS, counter, gauge, log_event
+from tokens import estimate_tokens
+
+# Per-model quota shared by every Gemini call in the process (0 disables a limit)
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))
+
+# Completion tokens reserved per call on top of the prompt estimate
+COMPLETION_TOKEN_RESERVE = int(os.environ.get("COMPLETION_TOKEN_RESERVE", "1000"))
+
+# Retry and circuit breaker settings (overridable through the environment)
+RETRY_ATTEMPTS = int(os.environ.get("LLM_RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "30"))
+BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
+# Longest a call waits for the API to recover before giving up
+BREAKER_MAX_WAIT = float(os.environ.get("LLM_BREAKER_MAX_WAIT", "300"))
+
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_RE = re.compile(
+    r"\b(?:429|500|502|503|504)\b|quota|rate.?limit|resource.?exhausted|unavailable|deadline|timed?.?out|overloaded",
+    re.IGNORECASE
+)
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRIES = counter("criblbot_llm_retries_total", "Model calls retried after a retryable error")
+FAILURES = counter("criblbot_llm_failures_total", "Model calls that failed, by whether they were retryable")
+
+
+class CircuitOpen(Exception):
+    """Raised when the model API stays unhealthy longer than a call is willing to wait"""
+
+
+# Function to decide whether a model error is worth retrying
+def is_retryable(error):
+    """Quota, overload, timeout and 5xx errors are retryable; bad requests are not"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int) and code in RETRYABLE_CODES:
+        return True
+    return bool(RETRYABLE_RE.search(f"{type(error).__name__} {error}"))
+
+
+class TokenBucket:
+    """Refills capacity units per period; callers reserve units and wait off any debt"""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.available = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Take amount units, returning how many seconds to wait before using them"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            self.available -= amount
+            return max(0.0, -self.available / self.rate)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one model"""
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def acquire(self, tokens):
+        """Block until one request of tokens fits in both quotas"""
+        wait = max(
+            self.requests.reserve(1) if self.requests else 0.0,
+            self.tokens.reserve(tokens) if self.tokens else 0.0,
+        )
+        if wait:
+            PHASE_SECONDS.observe(wait, phase="rate_limit_wait")
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """Holds calls back while the API keeps failing
+
+    After failure_threshold consecutive retryable failures the circuit opens
+    and callers wait instead of calling. Once cooldown has passed, one probe
+    call is let through; its success closes the circuit for everyone waiting.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, max_wait=BREAKER_MAX_WAIT):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._condition = threading.Condition()
+
+    def before_call(self):
+        """Wait until a call may go through, raising CircuitOpen after max_wait"""
+        deadline = time.monotonic() + self.max_wait
+        with self._condition:
+            while self.state != CLOSED:
+                now = time.monotonic()
+                if self.state == OPEN and now - self.opened_at >= self.cooldown:
+                    # This caller becomes the probe
+                    self._set_state(HALF_OPEN)
+                    return
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise CircuitOpen(f"Model API unhealthy for {self.max_wait:.0f}s; circuit breaker is open")
+                if self.state == OPEN:
+                    remaining = min(remaining, self.opened_at + self.cooldown - now)
+                self._condition.wait(remaining)
+
+    def record_success(self):
+        with self._condition:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+                self._condition.notify_all()
+
+    def record_failure(self):
+        with self._condition:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+                self._condition.notify_all()
+
+    def _set_state(self, state):
+        log_event("circuit_breaker", previous=self.state, state=state, failures=self.failures)
+        self.state = state
+
+
+class CallGuard:
+    """Rate limiting, jittered exponential retries and the circuit breaker around model calls"""
+
+    def __init__(self, model_name, limiter, breaker, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.model_name = model_name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, func, tokens):
+        """Return func(), retrying retryable errors"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            self.limiter.acquire(tokens)
+            try:
+                result = func()
+            except Exception as error:
+                if not self._should_retry(error, attempt):
+                    raise
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stream(self, factory, tokens):
+        """Yield from factory(), retrying retryable errors raised before the first chunk
+
+        Errors after the first chunk are raised, since the caller has already
+        seen part of the response.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            self.limiter.acquire(tokens)
+            started = False
+            try:
+                for chunk in factory():
+                    if not started:
+                        started = True
+                        self.breaker.record_success()
+                    yield chunk
+                if not started:
+                    self.breaker.record_success()
+                return
+            except Exception as error:
+                if started or not self._should_retry(error, attempt):
+                    raise
+
+    def _should_retry(self, error, attempt):
+        # A non-retryable error still means the API answered
+        if not is_retryable(error):
+            FAILURES.inc(model=self.model_name, retryable="false")
+            self.breaker.record_success()
+            return False
+        FAILURES.inc(model=self.model_name, retryable="true")
+        self.breaker.record_failure()
+        if attempt >= self.attempts:
+            return False
+        # Full jitter keeps a burst of failed calls from retrying in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        RETRIES.inc(model=self.model_name)
+        log_event("llm_retry", model=self.model_name, attempt=attempt, delay=round(delay, 3), error=str(error)[:200])
+        time.sleep(delay)
+        return True
+
+
+def _messages_tokens(messages):
+    return sum(estimate_tokens(str(message.content)) for message in messages) + COMPLETION_TOKEN_RESERVE
+
+
+class GuardedChatModel(BaseChatModel):
+    """Chat model that sends every call through the model's CallGuard"""
+
+    inner: BaseChatModel
+    model_name: str
+
+    @property
+    def _llm_type(self):
+        return f"guarded-{self.inner._llm_type}"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = get_call_guard(self.model_name).call(
+            lambda: self.inner.invoke(messages, stop=stop, **kwargs),
+            _messages_tokens(messages)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        chunks = get_call_guard(self.model_name).stream(
+            lambda: self.inner.stream(messages, stop=stop, **kwargs),
+            _messages_tokens(messages)
+        )
+        for message_chunk in chunks:
+            chunk = ChatGenerationChunk(message=message_chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def with_structured_output(self, schema, **kwargs):
+        structured = self.inner.with_structured_output(schema, **kwargs)
+        guard = get_call_guard(self.model_name)
+        return RunnableLambda(
+            lambda value: guard.call(
+                lambda: structured.invoke(value),
+                estimate_tokens(str(value)) + COMPLETION_TOKEN_RESERVE
+            )
+        )
+
+
+# Shared breaker: one unhealthy API holds back every model
+@lru_cache(maxsize=None)
+def get_circuit_breaker():
+    breaker = CircuitBreaker()
+    gauge(
+        "criblbot_llm_circuit_open",
+        "1 while the model API circuit breaker is open or probing",
+        lambda: [({}, 0 if breaker.state == CLOSED else 1)]
+    )
+    return breaker
+
+
+# One guard, and so one quota, per model name
+@lru_cache(maxsize=None)
+def get_call_guard(model_name):
+    return CallGuard(model_name, RateLimiter(), get_circuit_breaker())
@@ -0,0 +1,157 @@
+import os
+import threading
+from functools import lru_cache
+
+from metrics import counter, log_event
+
+# Pseudo model name that lets the router pick the model per batch
+AUTO_MODEL = "auto"
+
+# Routing settings (overridable through the environment)
+FAST_MODEL = os.environ.get("ROUTING_FAST_MODEL", "gemini-1.5-flash")
+STRONG_MODEL = os.environ.get("ROUTING_STRONG_MODEL", "gemini-1.5-pro")
+SMALL_BATCH_TOKENS = int(os.environ.get("ROUTING_SMALL_BATCH_TOKENS", "2000"))
+DIRECT_TRIAGE_SCORE = float(os.environ.get("ROUTING_DIRECT_TRIAGE_SCORE", "0.9"))
+
+# First-pass threat levels that are re-analyzed by the strong model
+ESCALATE_LEVELS = {"HIGH", "CRITICAL"}
+
+# Risk scores consistent with each threat level; anything else is low confidence
+RISK_SCORE_RANGES = {"LOW": (1, 3), "MEDIUM": (3, 6), "HIGH": (6, 8), "CRITICAL": (8, 10)}
+
+# USD per million prompt and completion tokens
+MODEL_PRICES = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.0-pro": (0.50, 1.50),
+}
+
+# Weight of the newest call in each model's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+ROUTES = counter("criblbot_model_routes_total", "Model routing decisions by route and final model")
+ROUTING_COST = counter("criblbot_routing_cost_usd_total", "Estimated model spend of routed analyses, actual and strong-model-only")
+ROUTING_SECONDS = counter("criblbot_routing_seconds_total", "Model latency of routed analyses, actual and strong-model-only")
+
+
+def call_cost(model_name, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model_name, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class ModelCall:
+    """One model pass over a batch"""
+
+    def __init__(self, model_name, prompt_tokens, completion_tokens, seconds):
+        self.model_name = model_name
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.seconds = seconds
+
+    @property
+    def cost(self):
+        return call_cost(self.model_name, self.prompt_tokens, self.completion_tokens)
+
+
+class ModelRouter:
+    """Sends batches to the fast model and escalates hard cases to the strong one
+
+    Every routed analysis is compared with sending the same batch straight to
+    the strong model: its cost from the final call's token counts, its latency
+    from the strong model's moving average once that has been observed.
+    """
+
+    def __init__(self, fast_model=FAST_MODEL, strong_model=STRONG_MODEL):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.latency = {}
+        self.stats = {
+            "analyses": 0,
+            "fast": 0,
+            "escalated": 0,
+            "direct": 0,
+            "cost": 0.0,
+            "baseline_cost": 0.0,
+            "seconds": 0.0,
+            "baseline_seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    def first_model(self, prompt_tokens, triage_score=None):
+        """Model for the first pass and the reason it was picked"""
+        if prompt_tokens <= SMALL_BATCH_TOKENS:
+            return self.fast_model, "small batch"
+        if triage_score is not None and triage_score >= DIRECT_TRIAGE_SCORE:
+            # A cheap pass is very likely to escalate anyway
+            return self.strong_model, f"triage score {triage_score:.2f}"
+        return self.fast_model, "low signal"
+
+    def escalation_reason(self, assessment):
+        """Why a first-pass assessment needs the strong model, or None"""
+        level = assessment["threat_level"]
+        score = assessment["risk_score"]
+        if level is None or score is None:
+            return "unparsed assessment"
+        if level in ESCALATE_LEVELS:
+            return f"first pass {level}"
+        low, high = RISK_SCORE_RANGES[level]
+        if not low <= score <= high:
+            return f"risk score {score} inconsistent with {level}"
+        return None
+
+    def record(self, route, calls, reason=None):
+        """Account for a routed analysis given its model calls in order"""
+        final = calls[-1]
+        cost = sum(call.cost for call in calls)
+        seconds = sum(call.seconds for call in calls)
+        baseline_cost = call_cost(self.strong_model, final.prompt_tokens, final.completion_tokens)
+
+        with self._lock:
+            for call in calls:
+                previous = self.latency.get(call.model_name)
+                self.latency[call.model_name] = call.seconds if previous is None else (
+                    LATENCY_SMOOTHING * call.seconds + (1 - LATENCY_SMOOTHING) * previous
+                )
+            baseline_seconds = final.seconds if final.model_name == self.strong_model else self.latency.get(self.strong_model)
+            self.stats["analyses"] += 1
+            self.stats[route] += 1
+            self.stats["cost"] += cost
+            self.stats["baseline_cost"] += baseline_cost
+            if baseline_seconds is not None:
+                self.stats["seconds"] += seconds
+                self.stats["baseline_seconds"] += baseline_seconds
+
+        ROUTES.inc(route=route, model=final.model_name)
+        ROUTING_COST.inc(cost, kind="actual")
+        ROUTING_COST.inc(baseline_cost, kind="strong_only")
+        if baseline_seconds is not None:
+            ROUTING_SECONDS.inc(seconds, kind="actual")
+            ROUTING_SECONDS.inc(baseline_seconds, kind="strong_only")
+        log_event(
+            "routing",
+            route=route,
+            reason=reason,
+            models=[call.model_name for call in calls],
+            cost=round(cost, 6),
+            baseline_cost=round(baseline_cost, 6),
+            seconds=round(seconds, 3),
+        )
+
+    def report(self):
+        """Route shares plus estimated cost and latency saved against strong-model-only"""
+        with self._lock:
+            stats = dict(self.stats)
+        analyses = stats["analyses"]
+        return {
+            **stats,
+            "fast_rate": stats["fast"] / analyses if analyses else 0.0,
+            "escalation_rate": stats["escalated"] / analyses if analyses else 0.0,
+            "cost_saved": stats["baseline_cost"] - stats["cost"],
+            "seconds_saved": stats["baseline_seconds"] - stats["seconds"],
+        }
+
+
+# Shared router so savings accumulate across sessions and the ingest endpoint
+@lru_cache(maxsize=None)
+def get_model_router():
+    return ModelRouter()
@@ -0,0 +1,212 @@
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from logmining import VARIABLE_PATTERNS
+from metrics import gauge
+from store import ANALYSIS_DB_PATH, get_store, unpack_text
+
+# Similarity index settings (overridable through the environment)
+SIMILARITY_DIM = int(os.environ.get("SIMILARITY_DIM", "256"))
+# Similar past incidents added to each analysis prompt (0 leaves prompts alone)
+SIMILARITY_PROMPT_MATCHES = int(os.environ.get("SIMILARITY_PROMPT_MATCHES", "0"))
+SIMILARITY_MIN_SCORE = float(os.environ.get("SIMILARITY_MIN_SCORE", "0.5"))
+
+# Characters of each analysis that are embedded
+EMBED_CHARS = 20000
+# IDF and row norms are refreshed once the corpus has grown by this share
+REFIT_GROWTH = 0.1
+BACKFILL_BATCH = 1000
+MATCH_FINDINGS_CHARS = 300
+
+WORD_RE = re.compile(r"[a-z_][a-z0-9_.\-/@]*[a-z0-9]|[a-z]")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_vectors (
+    analysis_id TEXT PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+"""
+
+
+# Function to embed a text offline
+def hashed_tf(text, dim=SIMILARITY_DIM):
+    """Sublinear term frequencies of word unigrams and bigrams, signed-hashed into dim buckets
+
+    Variable values (IPs, timestamps, numbers, IDs) are masked first, so a
+    recurring pattern embeds alike whatever hosts and times it involved.
+    """
+    text = text[:EMBED_CHARS].lower()
+    for pattern in VARIABLE_PATTERNS:
+        text = pattern.sub(" ", text)
+    words = WORD_RE.findall(text)
+    counts = np.zeros(dim, dtype=np.float32)
+    for term in words + [f"{first} {second}" for first, second in zip(words, words[1:])]:
+        bucket = zlib.crc32(term.encode())
+        counts[bucket % dim] += 1.0 if bucket & 0x80000000 else -1.0
+    return np.sign(counts) * np.log1p(np.abs(counts))
+
+
+class SimilarityIndex:
+    """Hashed n-gram TF-IDF vectors of stored analyses with NumPy top-k search
+
+    Rows live in one growable float32 matrix, so a lookup is a single
+    matrix-vector product. Vectors are persisted next to the analyses table
+    in the database at path and reloaded at startup instead of being
+    re-embedded.
+    """
+
+    def __init__(self, path=ANALYSIS_DB_PATH, dim=SIMILARITY_DIM):
+        self.path = path
+        self.dim = dim
+        self.ids = []
+        self.rows = {}
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)
+        self.document_frequency = np.zeros(dim, dtype=np.float32)
+        self.idf = np.ones(dim, dtype=np.float32)
+        self.norms = np.zeros(1024, dtype=np.float32)
+        self._fitted_count = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for analysis_id, blob in conn.execute("SELECT analysis_id, vector FROM analysis_vectors"):
+                vector = np.frombuffer(blob, dtype=np.float32)
+                if vector.size == dim:
+                    self._insert(analysis_id, vector)
+        self._refit()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, analysis_id, text):
+        """Embed and index an analysis, replacing any earlier vector for its ID"""
+        vector = hashed_tf(text, self.dim)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_vectors (analysis_id, vector) VALUES (?, ?)",
+                (analysis_id, vector.tobytes())
+            )
+        with self._lock:
+            self._insert(analysis_id, vector)
+            if len(self.ids) >= self._fitted_count * (1 + REFIT_GROWTH):
+                self._refit()
+
+    def search(self, text, k=5, exclude=None, min_score=0.0):
+        """Most similar indexed analyses to text, as (analysis_id, cosine score) pairs"""
+        return self._search(hashed_tf(text, self.dim), k, exclude, min_score)
+
+    def similar_to(self, analysis_id, k=5, min_score=0.0):
+        """Most similar indexed analyses to an indexed one"""
+        with self._lock:
+            row = self.rows.get(analysis_id)
+            vector = None if row is None else self.vectors[row].copy()
+        if vector is None:
+            return []
+        return self._search(vector, k, analysis_id, min_score)
+
+    def clear(self):
+        with self._lock:
+            self.ids = []
+            self.rows = {}
+            self.document_frequency[:] = 0
+            self._fitted_count = 0
+            self._refit()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM analysis_vectors")
+
+    def backfill(self, batch_size=BACKFILL_BATCH):
+        """Index stored analyses that have no vector yet"""
+        while True:
+            rows = self._connect().execute(
+                "SELECT analysis_id, prompt, response FROM analyses WHERE status = 'completed' "
+                "AND analysis_id NOT IN (SELECT analysis_id FROM analysis_vectors) LIMIT ?",
+                (batch_size,)
+            ).fetchall()
+            if not rows:
+                return
+            for analysis_id, prompt, response in rows:
+                self.add(analysis_id, f"{unpack_text(prompt)}\n{unpack_text(response)}")
+
+    def _insert(self, analysis_id, vector):
+        # Caller holds the lock (or is the constructor)
+        row = self.rows.get(analysis_id)
+        if row is None:
+            row = len(self.ids)
+            if row == len(self.vectors):
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.norms = np.concatenate([self.norms, np.zeros_like(self.norms)])
+            self.ids.append(analysis_id)
+            self.rows[analysis_id] = row
+        else:
+            self.document_frequency -= self.vectors[row] != 0
+        self.vectors[row] = vector
+        self.document_frequency += vector != 0
+        self.norms[row] = np.sqrt(np.square(vector * self.idf).sum())
+
+    def _refit(self):
+        # Smoothed IDF over the current corpus, and every row's norm under it
+        count = len(self.ids)
+        self.idf = (np.log((1 + count) / (1 + self.document_frequency)) + 1).astype(np.float32)
+        weights = np.square(self.idf)
+        for start in range(0, count, 10000):
+            block = self.vectors[start:min(count, start + 10000)]
+            self.norms[start:start + len(block)] = np.sqrt(np.square(block) @ weights)
+        self._fitted_count = count
+
+    def _search(self, vector, k, exclude, min_score):
+        with self._lock:
+            count = len(self.ids)
+            if not count:
+                return []
+            query = vector * self.idf
+            query_norm = float(np.sqrt(np.square(query).sum()))
+            if not query_norm:
+                return []
+            scores = (self.vectors[:count] @ (query * self.idf)) / (np.maximum(self.norms[:count], 1e-9) * query_norm)
+            if exclude is not None and exclude in self.rows:
+                scores[self.rows[exclude]] = -1.0
+            top = min(k, count)
+            candidates = np.argpartition(-scores, top - 1)[:top]
+            ranked = candidates[np.argsort(-scores[candidates])]
+            return [(self.ids[row], float(scores[row])) for row in ranked if scores[row] >= min_score]
+
+
+# Function to render past matches for the analysis prompt
+def render_matches(matches):
+    """Short block describing similar past incidents, or an empty string"""
+    lines = []
+    for analysis_id, score in matches:
+        record = get_store().get(analysis_id, full_prompt=False)
+        if record is None:
+            continue
+        findings = (record["findings"] or "").replace("\n", " ")[:MATCH_FINDINGS_CHARS]
+        lines.append(
+            f"- {analysis_id} ({record['timestamp']}, similarity {score:.2f}): "
+            f"{record['threat_level'] or 'UNKNOWN'}, risk {record['risk_score'] or '?'}. {findings}"
+        )
+    if not lines:
+        return ""
+    return "SIMILAR PAST INCIDENTS (earlier analyses of comparable activity):\n" + "\n".join(lines)
+
+
+# Shared index; stored analyses without vectors are indexed in the background
+@lru_cache(maxsize=None)
+def get_similarity_index():
+    index = SimilarityIndex()
+    threading.Thread(target=index.backfill, name="similarity-backfill", daemon=True).start()
+    gauge("criblbot_similarity_index_rows", "Analyses in the similar-incident index", lambda: [({}, len(index))])
+    return index
@@ -0,0 +1,300 @@
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+# Location of the analysis database (overridable through the environment)
+ANALYSIS_DB_PATH = os.environ.get("ANALYSIS_DB_PATH", "analysis_results.db")
+PREVIEW_CHARS = 500
+# zlib level for prompts and responses at rest (overridable through the environment; 0 stores plain text)
+STORE_COMPRESSION_LEVEL = int(os.environ.get("STORE_COMPRESSION_LEVEL", "6"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    analysis_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    status TEXT NOT NULL,
+    threat_level TEXT,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL
+);
+"""
+
+BASE_COLUMNS = {"analysis_id", "timestamp", "status", "threat_level", "prompt", "response"}
+
+# Columns added after the table was first created, migrated in place
+ADDED_COLUMNS = {
+    "reduction_ratio": "REAL",
+    "chunks": "INTEGER",
+    "risk_score": "INTEGER",
+    "findings": "TEXT",
+    "actions": "TEXT",
+    "triage_score": "REAL",
+    "model": "TEXT",
+    "route": "TEXT",
+    "coalesced": "INTEGER",
+}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses (timestamp, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_status ON analyses (status, timestamp, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_threat_level ON analyses (threat_level, timestamp, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_risk_score ON analyses (risk_score, timestamp, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_analyses_threat_level_risk_score ON analyses (threat_level, risk_score, timestamp, analysis_id);
+"""
+
+# Columns returned for list views; prompt and response are only loaded by get()
+SUMMARY_COLUMNS = "analysis_id, timestamp, status, threat_level, risk_score"
+
+# Columns stored compressed
+COMPRESSED_COLUMNS = ("prompt", "response")
+
+
+# Function to compress text for storage
+def pack_text(text, level=STORE_COMPRESSION_LEVEL):
+    """zlib-compressed UTF-8 as a BLOB, or the text itself when compression is off"""
+    if not level:
+        return text
+    return zlib.compress(text.encode("utf-8"), level)
+
+
+# Function to read text stored by pack_text
+def unpack_text(value, limit=None):
+    """Decompress a stored value, only as far as the first limit characters when given
+
+    Rows written before compression hold plain text and are returned as is.
+    """
+    if not isinstance(value, bytes):
+        return value if limit is None else value[:limit]
+    if limit is None:
+        return zlib.decompress(value).decode("utf-8")
+    # UTF-8 needs at most 4 bytes per character
+    head = zlib.decompressobj().decompress(value, limit * 4)
+    return head.decode("utf-8", errors="ignore")[:limit]
+
+
+class AnalysisStore:
+    """SQLite-backed analysis results shared across sessions and restarts"""
+
+    def __init__(self, path=ANALYSIS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(analyses)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} {column_type}")
+            conn.executescript(INDEXES)
+
+    def _connect(self):
+        # SQLite connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, analysis_id, prompt, response, status, threat_level=None, **fields):
+        """Insert or replace the whole record for an analysis ID
+
+        Fields not given are cleared, so nothing from an earlier run of the
+        same analysis ID is left on the record.
+        """
+        unknown = set(fields) - set(ADDED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown analysis fields: {', '.join(sorted(unknown))}")
+
+        values = {
+            "analysis_id": analysis_id,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "status": status,
+            "threat_level": threat_level,
+            "prompt": pack_text(prompt),
+            "response": pack_text(response),
+            **dict.fromkeys(ADDED_COLUMNS),
+            **fields,
+        }
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in values if column != "analysis_id")
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO analyses ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT (analysis_id) DO UPDATE SET {updates}",
+                list(values.values())
+            )
+
+    def set_status(self, analysis_id, status, response="", threat_level=None, **fields):
+        """Update the status and result fields of a saved analysis, leaving its prompt as is
+
+        Returns False when there is no record for the analysis ID.
+        """
+        unknown = set(fields) - set(ADDED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown analysis fields: {', '.join(sorted(unknown))}")
+
+        values = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "status": status,
+            "threat_level": threat_level,
+            "response": pack_text(response),
+            **fields,
+        }
+        with self._connect() as conn:
+            updated = conn.execute(
+                f"UPDATE analyses SET {', '.join(f'{column} = ?' for column in values)} WHERE analysis_id = ?",
+                list(values.values()) + [analysis_id]
+            ).rowcount
+        return updated > 0
+
+    def save_many(self, records):
+        """Insert or replace many results in one transaction
+
+        records are dicts with the same keys, using save()'s field names plus
+        an optional timestamp.
+        """
+        if not records:
+            return
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        columns = ["timestamp"] + [column for column in records[0] if column != "timestamp"]
+        unknown = set(columns) - BASE_COLUMNS - set(ADDED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown analysis fields: {', '.join(sorted(unknown))}")
+
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO analyses ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [
+                    [record.get("timestamp", now)] + [
+                        pack_text(record[column]) if column in COMPRESSED_COLUMNS else record[column]
+                        for column in columns[1:]
+                    ]
+                    for record in records
+                ]
+            )
+
+    def get(self, analysis_id, full_prompt=True):
+        """Return the full record for an analysis ID, or None
+
+        The log_preview is cut from the stored prompt on each call. With
+        full_prompt=False the prompt itself is left out and only as much of
+        it as the preview needs is decompressed.
+        """
+        row = self._connect().execute(
+            "SELECT * FROM analyses WHERE analysis_id = ?", (analysis_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        result = dict(row)
+        result["response"] = unpack_text(result["response"])
+        result["log_preview"] = unpack_text(result["prompt"], PREVIEW_CHARS)
+        if full_prompt:
+            result["prompt"] = unpack_text(result["prompt"])
+        else:
+            del result["prompt"]
+        return result
+
+    def page(self, limit=20, before=None, status=None, threat_level=None, since=None, until=None, order="newest"):
+        """Return up to limit results after the before cursor
+
+        order is "newest" (timestamp descending) or "risk" (risk score
+        descending, scored analyses only). before is the cursor() of the last
+        row of the previous page, so every page is an index range scan
+        regardless of its depth.
+        """
+        where, params = self._filters(status, threat_level, since, until)
+        if order == "risk":
+            key = "risk_score, timestamp, analysis_id"
+            where.append("risk_score IS NOT NULL")
+        else:
+            key = "timestamp, analysis_id"
+        if before is not None:
+            where.append(f"({key}) < ({', '.join('?' for _ in before)})")
+            params.extend(before)
+
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM analyses"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + ", ".join(f"{column} DESC" for column in key.split(", ")) + " LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    @staticmethod
+    def cursor(row, order="newest"):
+        """Keyset cursor of a row returned by page()"""
+        if order == "risk":
+            return (row["risk_score"], row["timestamp"], row["analysis_id"])
+        return (row["timestamp"], row["analysis_id"])
+
+    def iter_records(self, columns, status=None, threat_level=None, since=None, until=None, batch_size=1000):
+        """Yield the given columns of every matching record, oldest first
+
+        Rows are read one keyset page of batch_size at a time, so any number
+        of records can be walked in constant memory. Prompts and responses
+        come back decompressed.
+        """
+        unknown = set(columns) - BASE_COLUMNS - set(ADDED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown analysis fields: {', '.join(sorted(unknown))}")
+        after = None
+        while True:
+            where, params = self._filters(status, threat_level, since, until)
+            if after is not None:
+                where.append("(timestamp, analysis_id) > (?, ?)")
+                params.extend(after)
+            sql = f"SELECT {', '.join(columns)}, timestamp AS _ts, analysis_id AS _id FROM analyses"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY timestamp, analysis_id LIMIT ?"
+            params.append(batch_size)
+            rows = self._connect().execute(sql, params).fetchall()
+            for row in rows:
+                record = {column: row[column] for column in columns}
+                for column in COMPRESSED_COLUMNS:
+                    if column in record:
+                        record[column] = unpack_text(record[column])
+                yield record
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]["_ts"], rows[-1]["_id"])
+
+    def count(self, status=None, threat_level=None, since=None, until=None):
+        where, params = self._filters(status, threat_level, since, until)
+        sql = "SELECT COUNT(*) FROM analyses"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return self._connect().execute(sql, params).fetchone()[0]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM analyses")
+
+    @staticmethod
+    def _filters(status, threat_level, since, until):
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if threat_level:
+            where.append("threat_level = ?")
+            params.append(threat_level)
+        if since:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            where.append("timestamp < ?")
+            params.append(until)
+        return where, params
+
+
+# Shared store used by the Streamlit sessions, workers and ingest server
+@lru_cache(maxsize=None)
+def get_store():
+    # The path is read at first use, so a process can point the store elsewhere before then
+    return AnalysisStore(ANALYSIS_DB_PATH)
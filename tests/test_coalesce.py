@@ -0,0 +1,42 @@
+from coalesce import combine_batches, pack_groups, split_sections
+
+
+def test_split_sections_reads_combined_responses():
+    response = "=== BATCH 1 ===\nTHREAT LEVEL: LOW\n\n=== BATCH 2 ===\nTHREAT LEVEL: HIGH\n"
+    assert split_sections(response) == {1: "THREAT LEVEL: LOW", 2: "THREAT LEVEL: HIGH"}
+
+
+def test_split_sections_ignores_batch_mentions_inside_reports():
+    response = (
+        "=== BATCH 1 ===\n"
+        "- Batch 1 showed repeated failed logins\n"
+        "**BATCH 2** is unrelated\n"
+        "## Batch 2 summary\n"
+        "=== BATCH 2 ===\n"
+        "THREAT LEVEL: LOW"
+    )
+    sections = split_sections(response)
+    assert sections[1] == (
+        "- Batch 1 showed repeated failed logins\n"
+        "**BATCH 2** is unrelated\n"
+        "## Batch 2 summary"
+    )
+    assert sections[2] == "THREAT LEVEL: LOW"
+
+
+def test_split_sections_reads_combined_input():
+    prompt = combine_batches(["a-1", None], ["first batch", "second batch"])
+    assert split_sections(prompt) == {1: "first batch", 2: "second batch"}
+
+
+def test_split_sections_keeps_first_non_empty_section():
+    response = "=== BATCH 1 ===\n\n=== BATCH 1 ===\nfirst\n=== BATCH 1 ===\nsecond"
+    assert split_sections(response) == {1: "first"}
+
+
+def test_split_sections_without_headers():
+    assert split_sections("THREAT LEVEL: LOW") == {}
+
+
+def test_pack_groups_respects_token_budget():
+    assert pack_groups([("a", 600), ("b", 500), ("c", 300), ("d", 2000)], max_tokens=1000) == [["a"], ["b", "c"], ["d"]]
@@ -0,0 +1,46 @@
+import hashlib
+
+import pytest
+
+from dedup import DedupService
+
+
+def key(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "dedup.db")
+
+
+def test_only_the_first_delivery_is_new(path):
+    service = DedupService(path, window=60)
+    assert service.claim(key("batch"))
+    assert not service.claim(key("batch"))
+    assert service.claim(key("other batch"))
+
+
+def test_claims_are_shared_between_replicas(path):
+    first, second = DedupService(path, window=60), DedupService(path, window=60)
+    assert first.claim(key("batch"))
+    assert not second.claim(key("batch"))
+
+
+def test_released_claim_accepts_the_resend(path):
+    service = DedupService(path, window=60)
+    service.claim(key("batch"))
+    service.release(key("batch"))
+    assert service.claim(key("batch"))
+
+
+def test_expired_claim_is_new_again(path, monkeypatch):
+    service = DedupService(path, window=60)
+    now = [1000.0]
+    monkeypatch.setattr("dedup.time.time", lambda: now[0])
+    assert service.claim(key("batch"))
+    now[0] += 30
+    assert not service.claim(key("batch"))
+    # The window counts from the first delivery, not the latest resend
+    now[0] += 31
+    assert service.claim(key("batch"))
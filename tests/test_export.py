@@ -0,0 +1,40 @@
+import csv
+import io
+import json
+
+import pytest
+
+import export
+from export import ExportError, export_to_file
+from store import AnalysisStore
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    store = AnalysisStore(str(tmp_path / "analyses.db"))
+    store.save_many([
+        {"analysis_id": f"a{i}", "timestamp": f"2024-05-0{1 + i % 3} 00:00:00", "status": "completed",
+         "threat_level": "HIGH" if i % 2 else "LOW", "prompt": f"log {i}", "response": f"report {i}"}
+        for i in range(7)
+    ])
+    monkeypatch.setattr(export, "get_store", lambda: store)
+    return store
+
+
+def test_export_to_file_streams_every_matching_record():
+    with export_to_file("ndjson", batch_rows=2, threat_level="HIGH") as handle:
+        records = [json.loads(line) for line in handle]
+    assert [record["analysis_id"] for record in records] == ["a3", "a1", "a5"]
+    assert "prompt" not in records[0]
+
+
+def test_export_to_file_writes_csv_with_prompts():
+    with export_to_file("csv", include_prompt=True, batch_rows=3) as handle:
+        rows = list(csv.DictReader(io.TextIOWrapper(handle, encoding="utf-8")))
+    assert len(rows) == 7
+    assert rows[0]["prompt"].startswith("log ")
+
+
+def test_unknown_format_fails_before_writing():
+    with pytest.raises(ExportError):
+        export_to_file("xml")
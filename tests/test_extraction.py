@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+
+from extraction import ThreatAssessment, extract_assessment
+
+FORMATTED = """🚨 *THREAT LEVEL*: HIGH
+📊 *RISK SCORE*: 8/10
+🔍 *KEY FINDINGS*: Brute force against root.
+⚡ *IMMEDIATE ACTIONS*:
+- Block 10.0.0.7
+- Reset the root password
+🛡 *RECOMMENDATIONS*: Enable MFA."""
+
+
+class StubExtractor:
+    """Stands in for a chat model's with_structured_output(...).invoke"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, prompt):
+        self.calls += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_formatted_response_needs_no_model():
+    llm = StubExtractor(RuntimeError("must not be called"))
+    fields = extract_assessment(FORMATTED, llm=llm)
+    assert (fields["threat_level"], fields["risk_score"]) == ("HIGH", 8)
+    assert json.loads(fields["actions"]) == ["Block 10.0.0.7", "Reset the root password"]
+    assert llm.calls == 0
+
+
+def test_model_fills_in_unformatted_response():
+    assessment = ThreatAssessment(threat_level="LOW", risk_score=2, key_findings="Nothing", immediate_actions=[])
+    fields = extract_assessment("All quiet.", llm=StubExtractor(assessment))
+    assert (fields["threat_level"], fields["risk_score"], fields["actions"]) == ("LOW", 2, None)
+
+
+@pytest.mark.parametrize("result", [OutputParserException("not JSON"), None])
+def test_unparseable_output_falls_back_to_regex_fields(result):
+    fields = extract_assessment("All quiet.", llm=StubExtractor(result))
+    assert fields["threat_level"] is None and fields["risk_score"] is None
+
+
+def test_model_errors_are_raised():
+    with pytest.raises(RuntimeError):
+        extract_assessment("All quiet.", llm=StubExtractor(RuntimeError("400 API key not valid")))
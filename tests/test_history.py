@@ -0,0 +1,42 @@
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from history import HistoryStore
+
+
+def test_sessions_are_isolated():
+    store = HistoryStore()
+    store.get("browser-1").add_messages([HumanMessage("hello"), AIMessage("hi")])
+    store.get("webhook_a1").add_messages([HumanMessage("log batch")])
+    assert [message.content for message in store.get("browser-1").messages] == ["hello", "hi"]
+    assert [message.content for message in store.get("webhook_a1").messages] == ["log batch"]
+
+
+def test_least_recently_used_session_is_evicted():
+    store = HistoryStore(max_sessions=2)
+    store.get("a").add_messages([HumanMessage("from a")])
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert store.stats() == {"sessions": 2, "evictions": 1}
+    # b was evicted; without a disk path it comes back empty, a kept its messages
+    assert store.get("a").messages[0].content == "from a"
+
+
+def test_messages_are_capped():
+    store = HistoryStore(max_messages=3)
+    history = store.get("s")
+    history.add_messages([HumanMessage(f"m{i}") for i in range(5)])
+    assert [message.content for message in history.messages] == ["m2", "m3", "m4"]
+
+
+def test_evicted_session_reloads_from_disk(tmp_path):
+    store = HistoryStore(max_sessions=1, max_messages=3, path=str(tmp_path / "history.db"))
+    store.get("a").add_messages([HumanMessage(f"m{i}") for i in range(4)] + [AIMessageChunk(content="streamed")])
+    store.get("b")
+    reloaded = store.get("a")
+    assert [message.content for message in reloaded.messages] == ["m2", "m3", "streamed"]
+    assert type(reloaded.messages[-1]) is AIMessage
+    # Appending after a reload continues the sequence instead of overwriting it
+    reloaded.add_messages([HumanMessage("next")])
+    store.get("b")
+    assert [message.content for message in store.get("a").messages] == ["m3", "streamed", "next"]
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+import jobs
+from jobs import COMPLETED, ERROR, JobQueue, QueueFull
+
+
+class StubBatch:
+    content = "THREAT LEVEL: LOW"
+    details = {}
+    coalescable = False
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "store_analysis_result", lambda *args, **kwargs: calls.append((args, kwargs)))
+    monkeypatch.setattr(jobs, "prepare_log_batch", lambda *args, **kwargs: StubBatch())
+    return calls
+
+
+def test_job_finishes_when_recording_running_state_fails(monkeypatch, recorded):
+    def record(analysis_id, prompt, response, status, **details):
+        if status == "running":
+            raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(jobs, "store_analysis_result", record)
+
+    queue = JobQueue(max_workers=1, max_pending=0, coalesce_window=0)
+    job = queue.submit("a1", "log line")
+    assert job.wait(5)
+    assert job.status == ERROR
+    assert "database is locked" in job.error
+    # The slot came back
+    assert queue.submit("a2", "log line").wait(5)
+
+
+def test_submit_frees_the_slot_when_the_queued_record_fails(monkeypatch, recorded):
+    def record(*args, **details):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(jobs, "store_analysis_result", record)
+
+    queue = JobQueue(max_workers=1, max_pending=0, coalesce_window=0)
+    for _ in range(3):
+        with pytest.raises(sqlite3.OperationalError):
+            queue.submit("a1", "log line")
+    assert queue.depth()[jobs.QUEUED] == 0
+
+
+def test_prompt_is_only_written_when_queued(recorded):
+    queue = JobQueue(max_workers=1, max_pending=1, coalesce_window=0)
+    job = queue.submit("a1", "log line")
+    assert job.wait(5) and job.status == COMPLETED
+    assert [(args[3], kwargs["prompt_stored"]) for args, kwargs in recorded] == [
+        ("queued", False), ("running", True), ("completed", True)
+    ]
+
+
+def test_queue_full_is_raised_once_slots_are_taken(monkeypatch, recorded):
+    queue = JobQueue(max_workers=1, max_pending=0, coalesce_window=0)
+    monkeypatch.setattr(queue._executor, "submit", lambda *args: None)
+    queue.submit("a1", "log line")
+    with pytest.raises(QueueFull):
+        queue.submit("a2", "log line")
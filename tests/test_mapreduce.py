@@ -0,0 +1,41 @@
+from fake_llm import FakeChatModel
+from mapreduce import group_partials, reduce_partials
+from tokens import estimate_tokens
+
+
+class EchoModel(FakeChatModel):
+    """Answers with as many characters as it was sent, the worst case for reducing"""
+
+    def _response_for(self, messages):
+        CALLS.append(len(messages[-1].content))
+        return "x" * len(messages[-1].content)
+
+
+CALLS = []
+
+
+def test_group_partials_keeps_small_partials_whole():
+    partials = ["first report", "second report"]
+    assert group_partials(partials, 1000) == ["--- PARTIAL ANALYSIS 1 ---\nfirst report\n--- PARTIAL ANALYSIS 2 ---\nsecond report"]
+
+
+def test_group_partials_pairs_partials_over_half_the_budget():
+    groups = group_partials(["y" * 720] * 4, 250)
+    assert len(groups) == 2
+    assert all(estimate_tokens(group) <= 250 for group in groups)
+
+
+def test_reduce_partials_terminates_when_outputs_do_not_shrink():
+    CALLS.clear()
+    merged = reduce_partials(EchoModel(), ["y" * 720] * 4, token_budget=250)
+    # Two pairs, then the final merge
+    assert len(CALLS) == 3
+    assert merged
+
+
+def test_reduce_partials_stops_after_max_rounds():
+    CALLS.clear()
+    reduce_partials(EchoModel(), ["y" * 720] * 64, token_budget=250, max_rounds=2)
+    # 32 + 16 group merges, then one final merge of the 16 cut-down partials
+    assert len(CALLS) == 32 + 16 + 1
+    assert CALLS[-1] <= 250 * 4 + 2000
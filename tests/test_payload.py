@@ -0,0 +1,117 @@
+import base64
+import gzip
+
+import pytest
+
+from payload import PayloadDecoder, PayloadError, PayloadTooLarge, decode_payload, decode_prompt
+
+TEXT = b"".join(b'{"_raw": "sshd[%d]: Failed password for root from 10.0.0.%d"}\n' % (i, i % 256) for i in range(500))
+
+
+def feed_in_pieces(decoder, data, sizes):
+    output, start, i = [], 0, 0
+    while start < len(data):
+        size = sizes[i % len(sizes)]
+        output.append(decoder.feed(data[start:start + size]))
+        start += size
+        i += 1
+    output.append(decoder.finish())
+    return b"".join(output)
+
+
+def test_plain_text_passes_through():
+    assert decode_payload(TEXT) == TEXT
+
+
+def test_gzip_is_sniffed_from_magic_bytes():
+    assert decode_payload(gzip.compress(TEXT)) == TEXT
+
+
+def test_zstd_is_sniffed_from_magic_bytes():
+    zstandard = pytest.importorskip("zstandard")
+    assert decode_payload(zstandard.ZstdCompressor().compress(TEXT)) == TEXT
+
+
+def test_base64_gzip_is_sniffed():
+    assert decode_payload(base64.b64encode(gzip.compress(TEXT))) == TEXT
+
+
+@pytest.mark.parametrize("sizes", [[1], [3], [5, 7, 2], [4096]])
+def test_base64_leftovers_carry_over_between_pieces(sizes):
+    encoded = base64.b64encode(gzip.compress(TEXT))
+    # Line breaks as a MIME encoder would add them, and a trailing one
+    wrapped = b"\r\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76)) + b"\n"
+    assert feed_in_pieces(PayloadDecoder(), wrapped, sizes) == TEXT
+
+
+def test_unpadded_url_safe_base64_is_decoded():
+    encoded = base64.urlsafe_b64encode(gzip.compress(TEXT)).rstrip(b"=")
+    assert feed_in_pieces(PayloadDecoder(), encoded, [10]) == TEXT
+
+
+def test_content_encoding_wins_over_sniffing():
+    compressed = gzip.compress(TEXT)
+    # Declared identity: gzip bytes are passed through untouched
+    assert decode_payload(compressed, encoding="identity") == compressed
+    # Declared gzip: text that is not gzip is rejected, not passed through
+    with pytest.raises(PayloadError):
+        decode_payload(TEXT, encoding="gzip")
+
+
+def test_deflate_accepts_zlib_streams():
+    import zlib
+    assert decode_payload(zlib.compress(TEXT), encoding="deflate") == TEXT
+
+
+def test_unsupported_encoding_is_rejected():
+    with pytest.raises(PayloadError, match="unsupported"):
+        decode_payload(TEXT, encoding="br")
+
+
+def test_output_is_capped_while_inflating():
+    bomb = gzip.compress(b"\0" * (4 * 1024 * 1024))
+    decoder = PayloadDecoder(max_bytes=64 * 1024)
+    with pytest.raises(PayloadTooLarge):
+        feed_in_pieces(decoder, bomb, [1024])
+    # Never more than the limit (plus the one byte that trips it) was produced
+    assert decoder.size <= 64 * 1024 + 1
+
+
+def test_plain_text_is_capped():
+    with pytest.raises(PayloadTooLarge):
+        decode_payload(TEXT, max_bytes=len(TEXT) - 1)
+    assert decode_payload(TEXT, max_bytes=len(TEXT)) == TEXT
+
+
+def test_truncated_gzip_is_rejected():
+    compressed = gzip.compress(TEXT)
+    with pytest.raises(PayloadError, match="truncated"):
+        decode_payload(compressed[:len(compressed) // 2])
+
+
+def test_truncated_zstd_is_rejected():
+    zstandard = pytest.importorskip("zstandard")
+    compressed = zstandard.ZstdCompressor().compress(TEXT)
+    with pytest.raises(PayloadError, match="truncated"):
+        decode_payload(compressed[:len(compressed) // 2])
+
+
+def test_short_payload_is_decoded_on_finish():
+    assert decode_payload(b"ab") == b"ab"
+    assert decode_payload(b"") == b""
+
+
+def test_decode_prompt_decodes_base64_gzip():
+    prompt = base64.b64encode(gzip.compress(TEXT)).decode()
+    assert decode_prompt(prompt) == TEXT.decode()
+
+
+@pytest.mark.parametrize("prompt", ["H4sI is the start of this prompt", "KLUv: failed logins on host-7", "H4sIAAAA"])
+def test_decode_prompt_falls_back_to_plain_text(prompt):
+    assert decode_prompt(prompt) == prompt
+
+
+def test_decode_prompt_still_refuses_oversized_payloads():
+    prompt = base64.b64encode(gzip.compress(b"\0" * (1024 * 1024))).decode()
+    with pytest.raises(PayloadTooLarge):
+        decode_prompt(prompt, max_bytes=1024)
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+import resilience
+from fake_llm import FakeChatModel, FakeQuotaError
+from resilience import CLOSED, HALF_OPEN, OPEN, CallGuard, CircuitBreaker, CircuitOpen, RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record sleeps instead of taking them"""
+    slept = []
+    monkeypatch.setattr(resilience.time, "sleep", slept.append)
+    return slept
+
+
+def counting(model, calls):
+    def invoke():
+        calls.append(1)
+        return model.invoke("analyze this batch")
+    return invoke
+
+
+def test_token_bucket_paces_reservations_past_its_capacity():
+    bucket = TokenBucket(capacity=2, period=1.0)
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
+    # Each further unit waits for its share of the refill rate
+    assert bucket.reserve(1) == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_rate_limiter_waits_for_the_tighter_quota(sleeps):
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    assert limiter.acquire(1000) == 0.0
+    # The request quota has room; the token quota needs 500 of its 1000 per minute back
+    assert limiter.acquire(500) == pytest.approx(30.0, abs=0.5)
+    assert sleeps == [pytest.approx(30.0, abs=0.5)]
+
+
+def test_retry_gives_up_after_the_attempt_limit(sleeps):
+    guard = CallGuard("stub", RateLimiter(0, 0), CircuitBreaker(failure_threshold=100), attempts=3, base_delay=0.01)
+    calls = []
+    with pytest.raises(FakeQuotaError):
+        guard.call(counting(FakeChatModel(failure_rate=1.0), calls), tokens=10)
+    assert len(calls) == 3
+    # Backoff between attempts, none after the last
+    assert len(sleeps) == 2
+
+
+def test_non_retryable_errors_are_not_retried(sleeps):
+    guard = CallGuard("stub", RateLimiter(0, 0), CircuitBreaker(), attempts=3)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise ValueError("400 API key not valid")
+
+    with pytest.raises(ValueError):
+        guard.call(bad_request, tokens=10)
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_retry_recovers_from_a_transient_failure(sleeps):
+    guard = CallGuard("stub", RateLimiter(0, 0), CircuitBreaker(), attempts=3, base_delay=0.01)
+    failing, healthy = FakeChatModel(failure_rate=1.0), FakeChatModel()
+    models = iter([failing, healthy])
+    result = guard.call(lambda: next(models).invoke("analyze this batch"), tokens=10)
+    assert "THREAT LEVEL" in result.content
+
+
+def test_breaker_opens_after_repeated_failures(sleeps):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60, max_wait=0)
+    guard = CallGuard("stub", RateLimiter(0, 0), breaker, attempts=2, base_delay=0.01)
+    with pytest.raises(FakeQuotaError):
+        guard.call(counting(FakeChatModel(failure_rate=1.0), []), tokens=10)
+    assert breaker.state == OPEN
+    # Callers no longer reach the API
+    with pytest.raises(CircuitOpen):
+        guard.call(counting(FakeChatModel(), []), tokens=10)
+
+
+def test_half_open_probe_closes_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05, max_wait=5)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    guard = CallGuard("stub", RateLimiter(0, 0), breaker)
+    assert "THREAT LEVEL" in guard.call(lambda: FakeChatModel().invoke("probe"), tokens=10).content
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.05, max_wait=5)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == OPEN
@@ -0,0 +1,39 @@
+import pytest
+
+from routing import SMALL_BATCH_TOKENS, ModelCall, ModelRouter
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(fast_model="gemini-1.5-flash", strong_model="gemini-1.5-pro")
+
+
+def test_first_pass_model(router):
+    assert router.first_model(SMALL_BATCH_TOKENS)[0] == "gemini-1.5-flash"
+    assert router.first_model(SMALL_BATCH_TOKENS + 1, triage_score=0.2)[0] == "gemini-1.5-flash"
+    # A batch triage is already sure about goes straight to the strong model
+    assert router.first_model(SMALL_BATCH_TOKENS + 1, triage_score=0.95)[0] == "gemini-1.5-pro"
+
+
+@pytest.mark.parametrize("level, score, escalate", [
+    ("LOW", 2, False),
+    ("MEDIUM", 5, False),
+    ("HIGH", 7, True),
+    ("CRITICAL", 9, True),
+    ("LOW", 9, True),
+    (None, None, True),
+])
+def test_escalation_reason(router, level, score, escalate):
+    assert bool(router.escalation_reason({"threat_level": level, "risk_score": score})) is escalate
+
+
+def test_record_compares_with_strong_model_only(router):
+    router.record("direct", [ModelCall("gemini-1.5-pro", 1000, 100, 4.0)])
+    router.record("fast", [ModelCall("gemini-1.5-flash", 1000, 100, 1.0)])
+    router.record("escalated", [ModelCall("gemini-1.5-flash", 1000, 100, 1.0), ModelCall("gemini-1.5-pro", 1000, 100, 4.0)])
+    report = router.report()
+    assert (report["analyses"], report["fast"], report["escalated"], report["direct"]) == (3, 1, 1, 1)
+    # Only the fast-only analysis saves anything; the escalated one costs a flash pass extra
+    flash, pro = ModelCall("gemini-1.5-flash", 1000, 100, 0).cost, ModelCall("gemini-1.5-pro", 1000, 100, 0).cost
+    assert report["cost_saved"] == pytest.approx(pro - 2 * flash)
+    assert report["seconds_saved"] == pytest.approx(4.0 - 2 * 1.0)
@@ -0,0 +1,97 @@
+import pytest
+
+from store import AnalysisStore, pack_text, unpack_text
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.db"))
+    # Pairs of rows share a timestamp, so the analysis ID has to break ties
+    store.save_many([
+        {
+            "analysis_id": f"a{i:02d}",
+            "timestamp": f"2024-05-01 00:00:{i // 2:02d}",
+            "status": "completed",
+            "threat_level": "HIGH" if i % 3 == 0 else "LOW",
+            "risk_score": None if i % 5 == 0 else i % 7,
+            "prompt": f"log {i}",
+            "response": f"report {i}",
+        }
+        for i in range(25)
+    ])
+    return store
+
+
+def walk(store, limit, **kwargs):
+    rows, before = [], None
+    while True:
+        page = store.page(limit=limit, before=before, **kwargs)
+        rows.extend(page)
+        if len(page) < limit:
+            return rows
+        before = store.cursor(page[-1], kwargs.get("order", "newest"))
+
+
+@pytest.mark.parametrize("limit", [1, 4, 25, 30])
+def test_page_walks_every_row_once_newest_first(store, limit):
+    rows = walk(store, limit)
+    assert [row["analysis_id"] for row in rows] == [f"a{i:02d}" for i in reversed(range(25))]
+
+
+def test_page_applies_filters(store):
+    rows = walk(store, 3, threat_level="HIGH")
+    assert [row["analysis_id"] for row in rows] == [f"a{i:02d}" for i in reversed(range(0, 25, 3))]
+
+
+def test_page_by_risk_skips_unscored_rows(store):
+    rows = walk(store, 4, order="risk")
+    expected = sorted(
+        ((i % 7, f"2024-05-01 00:00:{i // 2:02d}", f"a{i:02d}") for i in range(25) if i % 5),
+        reverse=True
+    )
+    assert [(row["risk_score"], row["timestamp"], row["analysis_id"]) for row in rows] == expected
+
+
+def test_page_returns_summary_columns_only(store):
+    row = store.page(limit=1)[0]
+    assert set(row) == {"analysis_id", "timestamp", "status", "threat_level", "risk_score"}
+    assert store.get(row["analysis_id"])["response"] == "report 24"
+
+
+def test_set_status_keeps_the_prompt(store):
+    assert store.set_status("a03", "running")
+    assert store.set_status("a03", "completed", "new report", threat_level="LOW", risk_score=2)
+    record = store.get("a03")
+    assert (record["status"], record["response"], record["risk_score"]) == ("completed", "new report", 2)
+    assert record["prompt"] == "log 3"
+    assert not store.set_status("missing", "running")
+
+
+def test_save_clears_fields_from_an_earlier_run(store):
+    store.save("a03", "log 3 again", "", "queued")
+    record = store.get("a03")
+    assert record["risk_score"] is None and record["threat_level"] is None
+
+
+def test_pack_text_round_trips():
+    text = "Failed login for admin from 10.0.0.1 ✓\n" * 50
+    packed = pack_text(text)
+    assert isinstance(packed, bytes) and len(packed) < len(text)
+    assert unpack_text(packed) == text
+    assert unpack_text(packed, limit=10) == text[:10]
+    assert pack_text(text, level=0) == text
+
+
+def test_unpack_text_reads_plain_rows():
+    assert unpack_text("plain report") == "plain report"
+    assert unpack_text("plain report", limit=5) == "plain"
+
+
+def test_get_decompresses_prompt_and_preview(store):
+    store.save("big", "x" * 2000, "report", "completed")
+    stored = store._connect().execute("SELECT prompt FROM analyses WHERE analysis_id = 'big'").fetchone()[0]
+    assert isinstance(stored, bytes)
+    record = store.get("big")
+    assert record["prompt"] == "x" * 2000
+    assert record["log_preview"] == "x" * 500
+    assert "prompt" not in store.get("big", full_prompt=False)
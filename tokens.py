@@ -0,0 +1,8 @@
+# Rough characters-per-token ratio for Gemini on English and log text
+CHARS_PER_TOKEN = 4
+
+
+# Function to estimate the token count of a prompt fragment
+def estimate_tokens(text):
+    """Approximate token count without calling the tokenizer API"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,173 @@
+import os
+import random
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from events import parse_event
+
+# Triage settings (overridable through the environment)
+TRIAGE_ENABLED = os.environ.get("TRIAGE_ENABLED", "1") == "1"
+TRIAGE_THRESHOLD = float(os.environ.get("TRIAGE_THRESHOLD", "0.35"))
+TRIAGE_SHADOW_RATE = float(os.environ.get("TRIAGE_SHADOW_RATE", "0.05"))
+
+FAILED_AUTH_RE = re.compile(r"fail|invalid|denied|unauthori[sz]ed|bad password|locked out|\b4625\b|\b4771\b", re.IGNORECASE)
+PRIVILEGE_RE = re.compile(
+    r"\bsudo\b|\bsu\b|\broot\b|admin|privilege|runas|\b4672\b|\b4728\b|\b4732\b|setuid|chmod\s+[0-7]*7|/etc/(?:shadow|sudoers)",
+    re.IGNORECASE
+)
+SENSITIVE_RE = re.compile(
+    r"exfil|mimikatz|lsass|dump|usb|removable|upload|\.pst\b|\.kdbx\b|confidential|payroll|delete[sd]?\b|wipe|clear(?:ed)? log|\b1102\b",
+    re.IGNORECASE
+)
+
+FEATURE_NAMES = [
+    "failed_auth_ratio",
+    "off_hours_ratio",
+    "privilege_ratio",
+    "sensitive_present",
+    "rare_user_ratio",
+    "rare_host_ratio",
+]
+
+# Logistic weights over FEATURE_NAMES; a single sensitive keyword is enough to escalate
+FEATURE_WEIGHTS = np.array([4.0, 2.5, 3.5, 5.0, 2.0, 1.5])
+FEATURE_BIAS = -3.0
+
+# Entities seen fewer times than this are considered rare
+RARE_ENTITY_COUNT = 3
+MAX_TRACKED_ENTITIES = 100000
+
+LOW_RISK_TEMPLATE = """🚨 *THREAT LEVEL*: LOW
+📊 *RISK SCORE*: {risk_score}
+🔍 *KEY FINDINGS*: Local triage classified this batch of {events} events as routine (triage score {score:.2f}). Failed authentications {failed_auth_ratio:.0%}, off-hours activity {off_hours_ratio:.0%}, privileged operations {privilege_ratio:.0%}, rare users {rare_user_ratio:.0%}, rare hosts {rare_host_ratio:.0%}.
+⚡ *IMMEDIATE ACTIONS*: None required.
+🛡 *RECOMMENDATIONS*: Continue routine monitoring; this batch was not sent to the model."""
+
+
+class TriageDecision:
+    """Outcome of scoring one batch"""
+
+    def __init__(self, score, threshold, features, events, escalate, shadow):
+        self.score = score
+        self.threshold = threshold
+        self.features = features
+        self.events = events
+        self.escalate = escalate
+        self.shadow = shadow
+
+    def low_risk_response(self):
+        """Templated LOW result in the structured response format"""
+        return LOW_RISK_TEMPLATE.format(
+            risk_score=1 if self.score < self.threshold / 2 else 2,
+            events=self.events,
+            score=self.score,
+            **dict(zip(FEATURE_NAMES, self.features))
+        )
+
+
+class TriageScorer:
+    """Scores batches locally so routine traffic can skip the model
+
+    Escalated batches, plus a small shadow sample of bypassed ones, are
+    labelled by the model's threat level afterwards to estimate precision,
+    recall and the bypass rate.
+    """
+
+    def __init__(self, threshold=TRIAGE_THRESHOLD, shadow_rate=TRIAGE_SHADOW_RATE):
+        self.threshold = threshold
+        self.shadow_rate = shadow_rate
+        self.user_counts = Counter()
+        self.host_counts = Counter()
+        self.stats = {"batches": 0, "bypassed": 0, "tp": 0, "fp": 0, "fn": 0, "tn": 0}
+        self._lock = threading.Lock()
+
+    def features(self, log_text):
+        """Feature vector of a batch, in FEATURE_NAMES order"""
+        lines = [line for line in log_text.splitlines() if line.strip()]
+        if not lines:
+            return np.zeros(len(FEATURE_WEIGHTS)), 0
+
+        parsed = [parse_event(line) for line in lines]
+        hours = np.array([event["time"].hour if event["time"] else -1 for event in parsed])
+        timed = hours >= 0
+        off_hours = timed & ((hours < 7) | (hours >= 20))
+
+        with self._lock:
+            users = [event["user"] for event in parsed if event["user"]]
+            hosts = [event["host"] for event in parsed if event["host"]]
+            rare_users = np.array([self.user_counts[user] < RARE_ENTITY_COUNT for user in users], dtype=bool)
+            rare_hosts = np.array([self.host_counts[host] < RARE_ENTITY_COUNT for host in hosts], dtype=bool)
+            self._observe(self.user_counts, users)
+            self._observe(self.host_counts, hosts)
+
+        flags = np.array([
+            [bool(FAILED_AUTH_RE.search(line)), bool(PRIVILEGE_RE.search(line)), bool(SENSITIVE_RE.search(line))]
+            for line in lines
+        ])
+        features = np.array([
+            flags[:, 0].mean(),
+            off_hours.sum() / timed.sum() if timed.any() else 0.0,
+            flags[:, 1].mean(),
+            float(flags[:, 2].any()),
+            rare_users.mean() if rare_users.size else 0.0,
+            rare_hosts.mean() if rare_hosts.size else 0.0,
+        ])
+        return features, len(lines)
+
+    def score(self, features):
+        return float(1.0 / (1.0 + np.exp(-(features @ FEATURE_WEIGHTS + FEATURE_BIAS))))
+
+    def triage(self, log_text):
+        """Score a batch and decide whether it needs the model"""
+        features, events = self.features(log_text)
+        score = self.score(features)
+        escalate = score >= self.threshold
+        shadow = not escalate and random.random() < self.shadow_rate
+        with self._lock:
+            self.stats["batches"] += 1
+            if not escalate and not shadow:
+                self.stats["bypassed"] += 1
+        return TriageDecision(score, self.threshold, features.tolist(), events, escalate, shadow)
+
+    def record_outcome(self, decision, threat_level):
+        """Label a batch the model analyzed; MEDIUM and above counts as suspicious"""
+        if threat_level is None:
+            return
+        suspicious = threat_level != "LOW"
+        key = ("tp" if suspicious else "fp") if decision.escalate else ("fn" if suspicious else "tn")
+        with self._lock:
+            self.stats[key] += 1
+
+    def report(self):
+        """Bypass rate and precision/recall, with shadow samples scaled up to all bypassed batches"""
+        with self._lock:
+            stats = dict(self.stats)
+        scale = 1.0 / self.shadow_rate if self.shadow_rate else 0.0
+        estimated_fn = stats["fn"] * scale
+        flagged = stats["tp"] + stats["fp"]
+        positives = stats["tp"] + estimated_fn
+        return {
+            **stats,
+            "bypass_rate": stats["bypassed"] / stats["batches"] if stats["batches"] else 0.0,
+            "precision": stats["tp"] / flagged if flagged else None,
+            "recall": stats["tp"] / positives if positives else None,
+        }
+
+    @staticmethod
+    def _observe(counts, names):
+        counts.update(names)
+        if len(counts) > MAX_TRACKED_ENTITIES:
+            # Keep the established entities and forget one-off names
+            for name, count in list(counts.items()):
+                if count < RARE_ENTITY_COUNT:
+                    del counts[name]
+
+
+# Shared scorer so entity rarity is learned across every session
+@lru_cache(maxsize=None)
+def get_triage_scorer():
+    return TriageScorer()
@@ -1,14 +1,44 @@
 import os
+import time
 import streamlit as st
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_message_histories import StreamlitChatMessageHistory
-from langchain.memory import ConversationBufferMemory
+from langchain_core.runnables import RunnablePassthrough
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.prompts import ChatPromptTemplate
 import urllib.parse
 import json
-from datetime import datetime
-import re
+import uuid
+from datetime import timedelta
+
+from analysis import (
+    clear_analysis_results,
+    extract_analysis_id,
+    get_llm,
+    get_webhook_hash,
+)
+from baseline import get_entity_baselines
+from cache import get_response_cache
+from dedup import get_dedup_service
+from export import EXPORT_FORMATS, EXPORT_HTTP_URL, ExportError, export_results, export_to_file, push_results
+from extraction import THREAT_LEVELS
+from history import get_history_store
+from ingest import start_ingest_server
+from jobs import COMPLETED, QueueFull, get_job_queue
+from logmining import mining_stats
+from memory import HISTORY_TOKEN_BUDGET, messages_tokens
+from metrics import PHASE_SECONDS, timed
+from prompts import prompt_template
+from resilience import CLOSED, CircuitOpen, get_circuit_breaker
+from routing import AUTO_MODEL, FAST_MODEL, STRONG_MODEL, get_model_router
+from similarity import SIMILARITY_MIN_SCORE, get_similarity_index
+from payload import decode_prompt
+from store import PREVIEW_CHARS, get_store
+from tokens import estimate_tokens
+from triage import get_triage_scorer
+
+RESULTS_PAGE_SIZE = 20
+CHAT_PAGE_SIZE = 20
+MESSAGE_PREVIEW_CHARS = 2000
+
+script_start = time.perf_counter()
 
 # Load Gemini API key from secrets
 gemini_key = st.secrets.get("GEMINI_API_KEY")
@@ -18,60 +48,17 @@ if not gemini_key:
 
 os.environ["GOOGLE_API_KEY"] = gemini_key
 
-# Initialize analysis results storage in session state
-if "analysis_results" not in st.session_state:
-    st.session_state.analysis_results = {}
-
-# Initialize processed webhooks tracking
-if "processed_webhooks" not in st.session_state:
-    st.session_state.processed_webhooks = set()
-
-# Initialize Gemini LLM with selected model
-@st.cache_resource
-def get_llm(model_name):
-    return ChatGoogleGenerativeAI(model=model_name, temperature=0.6)
-
-# Setup memory with StreamlitChatMessageHistory
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = StreamlitChatMessageHistory()
-
-# Create memory object
-memory = ConversationBufferMemory(
-    chat_memory=st.session_state.chat_history, 
-    return_messages=True
-)
-
-# Enhanced system prompt for log analysis
-system_prompt = """You are an expert cybersecurity analyst specializing in insider threat detection and log analysis. 
-When analyzing logs, provide comprehensive analysis including:
-
-PREDICTIVE ANALYSIS:
-- Identify patterns that may indicate potential future security incidents
-- Assess risk levels (LOW/MEDIUM/HIGH/CRITICAL) based on observed behaviors
-- Predict likely attack vectors or escalation paths
-- Estimate probability of insider threat scenarios
-
-PRESCRIPTIVE ANALYSIS:  
-- Recommend specific immediate actions to take
-- Suggest preventive measures and security controls
-- Provide step-by-step incident response procedures
-- Recommend monitoring and detection improvements
-- Suggest policy and process enhancements
-
-STRUCTURED RESPONSE FORMAT:
-🚨 *THREAT LEVEL*: [LOW/MEDIUM/HIGH/CRITICAL]
-📊 *RISK SCORE*: [1-10]
-🔍 *KEY FINDINGS*: Brief summary
-⚡ *IMMEDIATE ACTIONS*: Critical next steps
-🛡 *RECOMMENDATIONS*: Long-term improvements
+# Start the Cribl ingest endpoint once per server process
+@st.cache_resource(show_spinner=False)
+def get_ingest_server():
+    # Host, port and token come from the INGEST_* environment variables
+    return start_ingest_server()
 
-Focus on behavioral indicators, technical monitoring, anomaly detection, and actionable security recommendations."""
+get_ingest_server()
 
-prompt_template = ChatPromptTemplate.from_messages([
-    ("system", system_prompt),
-    ("placeholder", "{history}"),
-    ("human", "{input}")
-])
+# Each browser session keeps its own conversation in the shared history store
+if "chat_session_id" not in st.session_state:
+    st.session_state.chat_session_id = f"chat_{uuid.uuid4().hex}"
 
 # Streamlit UI configuration
 st.set_page_config(
@@ -83,6 +70,7 @@ st.set_page_config(
 
 # Custom CSS for styling
 # Custom CSS for teal and white theme
+css_start = time.perf_counter()
 st.markdown("""
 <style>
     /* Main background */
@@ -254,6 +242,7 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+PHASE_SECONDS.observe(time.perf_counter() - css_start, phase="css_injection")
 
 
 # Custom header
@@ -264,39 +253,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 st.markdown('<p class="subtitle">Automated log analysis with predictive and prescriptive insights</p>', unsafe_allow_html=True)
-
-# Function to extract analysis ID from webhook prompt
-def extract_analysis_id(prompt_text):
-    """Extract analysis ID from webhook prompt"""
-    patterns = [
-        r"Analysis ID:\s*([a-zA-Z0-9-]+)",
-        r"REQUEST #([a-zA-Z0-9-]+)",
-        r"analysis request #([a-zA-Z0-9-]+)"
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, prompt_text, re.IGNORECASE)
-        if match:
-            return match.group(1)
-    return None
-
-# Function to store analysis result
-def store_analysis_result(analysis_id, prompt, response_content, status="completed"):
-    """Store analysis result in session state"""
-    if analysis_id:
-        st.session_state.analysis_results[analysis_id] = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "prompt": prompt,
-            "response": response_content,
-            "status": status,
-            "log_preview": prompt[:500] if len(prompt) > 500 else prompt
-        }
-
-# Function to create webhook hash for duplicate detection
-def get_webhook_hash(prompt):
-    """Create a simple hash of the webhook prompt to detect duplicates"""
-    import hashlib
-    return hashlib.md5(prompt.encode()).hexdigest()[:8]
+PHASE_SECONDS.observe(time.perf_counter() - script_start, phase="script_startup")
 
 # Check for webhook prompt parameter
 query_params = st.query_params
@@ -306,7 +263,8 @@ is_webhook_request = False
 
 if "prompt" in query_params:
     try:
-        webhook_prompt = urllib.parse.unquote_plus(query_params["prompt"])
+        # Cribl may send the batch as base64 gzip or zstd to fit more in the URL
+        webhook_prompt = decode_prompt(urllib.parse.unquote_plus(query_params["prompt"]))
         analysis_id = extract_analysis_id(webhook_prompt)
         is_webhook_request = True
         
@@ -318,7 +276,7 @@ if "prompt" in query_params:
             <strong>🔗 Webhook Request Received</strong><br>
             Analysis ID: <code>{analysis_id or 'Auto-generated'}</code><br>
             Processing log analysis request from Cribl Stream...<br>
-            <small>Hash: {webhook_hash}</small>
+            <small>Hash: {webhook_hash[:16]}</small>
         </div>
         """, unsafe_allow_html=True)
         
@@ -326,42 +284,82 @@ if "prompt" in query_params:
         st.error(f"Error processing webhook prompt: {str(e)}")
         webhook_prompt = None
 
+# Webhook analyses get their own conversation, so each starts from a minimal context
+if webhook_prompt:
+    history_session_id = f"webhook_{analysis_id or 'auto_' + webhook_hash}"
+else:
+    history_session_id = st.session_state.chat_session_id
+chat_history = get_history_store().get(history_session_id)
+history_memory = chat_history.memory
+
 # Sidebar with enhanced options
 with st.sidebar:
     st.markdown('<h3 class="sidebar-header">🎛 Model Settings</h3>', unsafe_allow_html=True)
     model_choice = st.selectbox(
         "Select Gemini Model:",
-        ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.0-pro"],
+        [AUTO_MODEL, "gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.0-pro"],
+        index=0,
+        format_func=lambda model: f"Auto ({FAST_MODEL} → {STRONG_MODEL})" if model == AUTO_MODEL else model,
+        help="Auto analyzes log batches with the fast model and escalates HIGH/CRITICAL or uncertain results to the stronger one"
+    )
+    
+    memory_mode = st.selectbox(
+        "Conversation Memory:",
+        ["Token-bounded summary", "Full history"],
         index=0,
-        help="gemini-1.5-flash is faster, gemini-1.5-pro is more capable"
+        help="Token-bounded summary keeps recent turns verbatim and summarizes older ones"
+    )
+    history_memory.token_budget = st.number_input(
+        "History token budget:",
+        min_value=500,
+        max_value=100000,
+        value=HISTORY_TOKEN_BUDGET,
+        step=500,
+        disabled=memory_mode != "Token-bounded summary"
     )
     
-    # Get LLM instance
-    llm = get_llm(model_choice)
+    # Get LLM instance; chat turns under auto routing use the fast model
+    chat_model = FAST_MODEL if model_choice == AUTO_MODEL else model_choice
+    llm = get_llm(chat_model)
     
     # Create conversation chain
+    chat_runnable = prompt_template | llm
+    if memory_mode == "Token-bounded summary":
+        chat_runnable = RunnablePassthrough.assign(
+            history=lambda inputs, config: get_history_store().get(
+                config["configurable"]["session_id"]
+            ).memory.compact(inputs["history"], llm)
+        ) | chat_runnable
+    
     chat_chain = RunnableWithMessageHistory(
-        prompt_template | llm,
-        get_session_history=lambda session_id: st.session_state.chat_history,
+        chat_runnable,
+        get_session_history=get_history_store().get,
         input_messages_key="input",
         history_messages_key="history"
     )
     
     st.markdown('<h3 class="sidebar-header">⚙ Options</h3>', unsafe_allow_html=True)
     if st.button("🗑 Clear Chat History", use_container_width=True):
-        st.session_state.chat_history.clear()
-        st.session_state.processed_webhooks.clear()
+        chat_history.clear()
         st.rerun()
     
     if st.button("🧹 Clear Analysis Results", use_container_width=True):
-        st.session_state.analysis_results.clear()
+        clear_analysis_results()
+        st.session_state.pop("results_filters", None)
         st.rerun()
     
+    # Prompt size of the conversation history
+    history_tokens = messages_tokens(chat_history.messages)
+    if memory_mode == "Token-bounded summary":
+        st.caption(f"History: {history_memory.last_sent_tokens} tokens sent last turn of {history_tokens} stored")
+    else:
+        st.caption(f"History: {history_tokens} tokens sent each turn")
+    
     # Webhook status
     st.markdown('<h3 class="sidebar-header">🔗 Webhook Status</h3>', unsafe_allow_html=True)
     if is_webhook_request:
         st.success("✅ Webhook request active")
-        st.info(f"Analyzing {len(webhook_prompt)} characters")
+        st.info(f"Analyzing {len(webhook_prompt)} characters (~{estimate_tokens(webhook_prompt)} tokens)")
         if analysis_id:
             st.code(f"ID: {analysis_id}")
         else:
@@ -369,10 +367,38 @@ with st.sidebar:
     else:
         st.info("⏳ Waiting for webhook requests")
     
+    queue_depth = get_job_queue().depth()
+    st.caption(f"Analysis queue: {queue_depth['queued']} queued, {queue_depth['running']} running")
+    if mining_stats["compact_tokens"]:
+        st.caption(f"Log template mining: {mining_stats['original_tokens'] / mining_stats['compact_tokens']:.1f}× fewer prompt tokens")
+    baseline_stats = get_entity_baselines().stats()
+    if baseline_stats["batches"]:
+        st.caption(f"Behavioral baselines: {baseline_stats['users']} users, {baseline_stats['hosts']} hosts over {baseline_stats['batches']} batches")
+    triage_report = get_triage_scorer().report()
+    if triage_report["batches"]:
+        precision = f"{triage_report['precision']:.0%}" if triage_report["precision"] is not None else "n/a"
+        recall = f"{triage_report['recall']:.0%}" if triage_report["recall"] is not None else "n/a"
+        st.caption(f"Local triage: {triage_report['bypass_rate']:.0%} bypassed · precision {precision} · recall {recall}")
+    if get_circuit_breaker().state != CLOSED:
+        st.warning(f"⚠ Gemini API unhealthy: circuit breaker {get_circuit_breaker().state}, analyses are waiting")
+    routing_report = get_model_router().report()
+    if routing_report["analyses"]:
+        st.caption(
+            f"Model routing: {routing_report['fast_rate']:.0%} fast · {routing_report['escalation_rate']:.0%} escalated · "
+            f"~${routing_report['cost_saved']:.4f} and {routing_report['seconds_saved']:.0f}s saved vs {STRONG_MODEL}"
+        )
+    cache_stats = get_response_cache().stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%})")
+    
+    st.caption(f"Batch ingest: POST JSON/NDJSON to :{get_ingest_server().config.port}/ingest")
+    
     # Results summary
-    if st.session_state.analysis_results:
+    total_analyses = get_store().count()
+    if total_analyses:
         st.markdown('<h3 class="sidebar-header">📊 Analysis Results</h3>', unsafe_allow_html=True)
-        st.info(f"Total analyses: {len(st.session_state.analysis_results)}")
+        st.info(f"Total analyses: {total_analyses}")
+        threat_counts = {level: get_store().count(threat_level=level) for level in THREAT_LEVELS}
+        st.caption(" · ".join(f"{level}: {count}" for level, count in threat_counts.items()))
         
         if st.button("📋 View All Results", use_container_width=True):
             st.session_state.show_results = True
@@ -393,6 +419,8 @@ with st.sidebar:
             st.session_state.selected_question = question
 
 # Show results view if requested
+render_start = time.perf_counter()
+render_phase = "render_dashboard" if st.session_state.get("show_results") else "render_chat"
 if hasattr(st.session_state, 'show_results') and st.session_state.show_results:
     st.markdown("## 📊 Analysis Results Dashboard")
     
@@ -400,54 +428,179 @@ if hasattr(st.session_state, 'show_results') and st.session_state.show_results:
         del st.session_state.show_results
         st.rerun()
     
-    if st.session_state.analysis_results:
-        # Sort results by timestamp (newest first)
-        sorted_results = sorted(
-            st.session_state.analysis_results.items(),
-            key=lambda x: x[1]['timestamp'],
-            reverse=True
-        )
+    # Filters served by the indexed results store
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+    with filter_col1:
+        status_filter = st.selectbox("Status", ["All", "completed", "error", "running", "queued"])
+    with filter_col2:
+        threat_filter = st.selectbox("Threat Level", ["All"] + THREAT_LEVELS)
+    with filter_col3:
+        date_range = st.date_input("Date Range", value=())
+    with filter_col4:
+        sort_choice = st.selectbox("Sort By", ["Newest first", "Highest risk first"])
+    result_order = "risk" if sort_choice == "Highest risk first" else "newest"
+    
+    result_filters = {
+        "status": None if status_filter == "All" else status_filter,
+        "threat_level": None if threat_filter == "All" else threat_filter,
+        "since": date_range[0].strftime("%Y-%m-%d") if len(date_range) > 0 else None,
+        "until": (date_range[1] + timedelta(days=1)).strftime("%Y-%m-%d") if len(date_range) > 1 else None,
+    }
+    
+    # Every match of the filters at once, served by this session so no unauthenticated link is needed
+    with st.expander("📤 Bulk Export"):
+        export_col1, export_col2 = st.columns(2)
+        with export_col1:
+            export_format = st.selectbox("Format", list(EXPORT_FORMATS))
+        with export_col2:
+            export_prompts = st.checkbox("Include log batches", value=False)
+        try:
+            # Fails fast for a format that cannot be produced; no rows are read here
+            export_results(export_format, export_prompts, **result_filters)
+        except ExportError as e:
+            st.error(f"❌ Export unavailable: {e}")
+        else:
+            media_type, extension = EXPORT_FORMATS[export_format]
+            # Only built when clicked, streamed into a temporary file rather than held by the session
+            st.download_button(
+                "⬇ Download matching analyses",
+                lambda: export_to_file(export_format, export_prompts, **result_filters),
+                file_name=f"analyses_{time.strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=media_type
+            )
+        if EXPORT_HTTP_URL and st.button("📡 Push to Cribl"):
+            try:
+                with st.spinner("Pushing analyses..."):
+                    pushed = push_results(include_prompt=export_prompts, **result_filters)
+                st.success(f"Pushed {pushed} analyses to {EXPORT_HTTP_URL}")
+            except ExportError as e:
+                st.error(f"❌ Push failed: {e}")
+    
+    # Keyset cursors of the pages visited so far
+    if st.session_state.get("results_filters") != (result_filters, result_order):
+        st.session_state.results_filters = (result_filters, result_order)
+        st.session_state.results_cursors = [None]
+    
+    store = get_store()
+    results_page = store.page(
+        limit=RESULTS_PAGE_SIZE + 1,
+        before=st.session_state.results_cursors[-1],
+        order=result_order,
+        **result_filters
+    )
+    has_next_page = len(results_page) > RESULTS_PAGE_SIZE
+    results_page = results_page[:RESULTS_PAGE_SIZE]
+    
+    if results_page:
+        st.caption(f"{store.count(**result_filters)} matching analyses · page {len(st.session_state.results_cursors)}")
         
-        for result_id, result in sorted_results:
-            status_color = "🟢" if result['status'] == 'completed' else "🔴"
+        for result in results_page:
+            result_id = result['analysis_id']
+            status_color = {"completed": "🟢", "error": "🔴"}.get(result['status'], "🟡")
+            threat_badge = f" · {result['threat_level']} ({result['risk_score'] or '?'}/10)" if result['threat_level'] else ""
+            is_expanded = st.session_state.get("expanded_result") == result_id
+            
+            # One summary row per result; details load only for the expanded one
+            row_col, toggle_col = st.columns([5, 1])
+            with row_col:
+                st.markdown(f"{status_color} *Analysis {result_id}* - {result['timestamp']}{threat_badge}")
+            with toggle_col:
+                if st.button("▲ Hide" if is_expanded else "▼ View", key=f"toggle_{result_id}", use_container_width=True):
+                    st.session_state.expanded_result = None if is_expanded else result_id
+                    st.rerun()
+            
+            if not is_expanded:
+                continue
             
-            with st.expander(f"{status_color} Analysis {result_id} - {result['timestamp']}"):
+            detail = store.get(result_id, full_prompt=False)
+            if detail is None:
+                continue
+            with st.container(border=True):
                 col1, col2 = st.columns([3, 1])
                 
                 with col1:
-                    st.markdown(f"*Status:* {result['status']}")
+                    st.markdown(f"*Status:* {detail['status']}")
+                    if detail['threat_level']:
+                        st.markdown(f"*Threat Level:* {detail['threat_level']}")
+                    if detail['risk_score']:
+                        st.markdown(f"*Risk Score:* {detail['risk_score']}/10")
+                    if detail['model']:
+                        st.markdown(f"*Model:* {detail['model']} ({detail['route']})")
+                    if detail['triage_score'] is not None:
+                        st.markdown(f"*Triage Score:* {detail['triage_score']:.2f}")
+                    if detail['reduction_ratio']:
+                        st.markdown(f"*Prompt Reduction:* {detail['reduction_ratio']:.1f}×")
+                    if detail['chunks'] and detail['chunks'] > 1:
+                        st.markdown(f"*Map-Reduce Chunks:* {detail['chunks']}")
                     st.markdown("*Log Preview:*")
-                    st.code(result.get('log_preview', 'N/A'), language="text")
+                    st.code(detail['log_preview'], language="text")
+                    
+                    # Earlier analyses of comparable activity
+                    similar = get_similarity_index().similar_to(result_id, k=3, min_score=SIMILARITY_MIN_SCORE)
+                    if similar:
+                        st.markdown("*Similar Incidents:*")
+                        for similar_id, score in similar:
+                            match = store.get(similar_id, full_prompt=False)
+                            if match:
+                                st.caption(
+                                    f"{similar_id} · {match['timestamp']} · {match['threat_level'] or 'N/A'}"
+                                    f" · risk {match['risk_score'] or '?'} · similarity {score:.0%}"
+                                )
                 
                 with col2:
-                    st.download_button(
-                        label="📥 Download",
-                        data=json.dumps(result, indent=2),
-                        file_name=f"analysis_{result_id}.json",
-                        mime="application/json",
-                        key=f"download_{result_id}"
-                    )
+                    # Build the JSON payload only once it is asked for
+                    if st.session_state.get("download_ready") == result_id:
+                        st.download_button(
+                            label="📥 Download",
+                            data=json.dumps(store.get(result_id), indent=2),
+                            file_name=f"analysis_{result_id}.json",
+                            mime="application/json",
+                            key=f"download_{result_id}"
+                        )
+                    elif st.button("📦 Prepare Download", key=f"prepare_{result_id}"):
+                        st.session_state.download_ready = result_id
+                        st.rerun()
                 
                 st.markdown("*Analysis Response:*")
-                st.markdown(result['response'])
+                st.markdown(detail['response'])
+        
+        prev_col, next_col = st.columns(2)
+        with prev_col:
+            if len(st.session_state.results_cursors) > 1 and st.button("← Previous"):
+                st.session_state.results_cursors.pop()
+                st.rerun()
+        with next_col:
+            if has_next_page and st.button("Next →"):
+                st.session_state.results_cursors.append(store.cursor(results_page[-1], result_order))
+                st.rerun()
     else:
         st.info("No analysis results available yet.")
 
 else:
     # Regular chat interface
     
-    # Display chat messages
-    for message in st.session_state.chat_history.messages:
+    # Display the most recent chat messages, loading earlier ones on request
+    chat_messages = chat_history.messages
+    visible_messages = st.session_state.setdefault("visible_messages", CHAT_PAGE_SIZE)
+    if len(chat_messages) > visible_messages:
+        if st.button(f"⬆ Show earlier messages ({len(chat_messages) - visible_messages} hidden)"):
+            st.session_state.visible_messages += CHAT_PAGE_SIZE
+            st.rerun()
+    for message in chat_messages[-visible_messages:]:
         with st.chat_message(message.type):
-            st.write(message.content)
+            # Pasted and webhook log batches are shown as a preview, not resent in full
+            if message.type == "human" and len(message.content) > MESSAGE_PREVIEW_CHARS:
+                st.code(message.content[:MESSAGE_PREVIEW_CHARS], language="text")
+                st.caption(f"… {len(message.content) - MESSAGE_PREVIEW_CHARS:,} more characters not shown")
+            else:
+                st.write(message.content)
 
     # Handle webhook prompt automatically
     if webhook_prompt:
         webhook_hash = get_webhook_hash(webhook_prompt)
         
-        # Check if this webhook was already processed
-        if webhook_hash not in st.session_state.processed_webhooks:
-            st.session_state.processed_webhooks.add(webhook_hash)
+        # Check if this webhook was already processed by any session or replica
+        if get_dedup_service().claim(webhook_hash):
             
             # If no analysis_id, generate one
             if not analysis_id:
@@ -459,45 +612,60 @@ else:
                 if analysis_id:
                     st.write(f"*Analysis ID:* {analysis_id}")
                 
-                # Show log preview in a nice format
+                # Only a preview of the batch goes back to the browser, as plain text
                 st.markdown("*Log Data:*")
-                st.markdown('<div class="log-preview">' + webhook_prompt + '</div>', unsafe_allow_html=True)
+                st.code(webhook_prompt[:PREVIEW_CHARS], language="text")
+                if len(webhook_prompt) > PREVIEW_CHARS:
+                    st.caption(f"… {len(webhook_prompt) - PREVIEW_CHARS:,} more characters not shown")
             
-            # Generate and display bot response
+            # Queue the analysis and poll its job state
             with st.chat_message("assistant"):
-                with st.spinner("🔍 Performing predictive and prescriptive log analysis..."):
-                    try:
-                        response = chat_chain.invoke(
-                            {"input": webhook_prompt},
-                            config={"configurable": {"session_id": f"webhook_{analysis_id}"}}
-                        )
-                        st.write(response.content)
-                        
-                        # Store the result
-                        store_analysis_result(analysis_id, webhook_prompt, response.content, "completed")
+                try:
+                    job = get_job_queue().submit(analysis_id, webhook_prompt, model_name=model_choice, dedup_key=webhook_hash)
+                except QueueFull:
+                    job = None
+                    get_dedup_service().release(webhook_hash)
+                    st.error("❌ Analysis queue is full. Please retry the webhook shortly.")
+                except Exception as e:
+                    job = None
+                    get_dedup_service().release(webhook_hash)
+                    st.error(f"❌ Could not queue the analysis: {e}")
+                
+                if job:
+                    job_status = st.empty()
+                    response_box = st.empty()
+                    with st.spinner("🔍 Performing predictive and prescriptive log analysis..."):
+                        # Render tokens as the worker streams them in
+                        while not job.wait(timeout=0.2):
+                            job_status.caption(f"Job {job.job_id[:8]}: {job.status}")
+                            if job.partial_text:
+                                response_box.markdown(job.partial_text + "▌")
+                    job_status.empty()
+                    
+                    if job.status == COMPLETED:
+                        response_box.markdown(job.result)
+                        chat_history.add_user_message(webhook_prompt)
+                        chat_history.add_ai_message(job.result)
                         
                         # Show success message
                         st.markdown(f"""
                         <div class="analysis-result">
                             <strong>✅ Analysis Complete</strong><br>
                             Analysis ID: <code>{analysis_id}</code><br>
+                            Model: {job.details.get("model") or "n/a"} ({job.details.get("route") or "cached"})<br>
+                            Prompt reduction: {job.details.get("reduction_ratio") or 1.0:.1f}×<br>
                             Results stored and available in the dashboard.
                         </div>
                         """, unsafe_allow_html=True)
-                        
-                    except Exception as e:
-                        error_msg = str(e)
+                    else:
                         st.markdown(f"""
                         <div class="error-result">
                             <strong>❌ Analysis Error</strong><br>
-                            {error_msg}
+                            {job.error}
                         </div>
                         """, unsafe_allow_html=True)
-                        
-                        # Store error result
-                        store_analysis_result(analysis_id, webhook_prompt, f"Error: {error_msg}", "error")
         else:
-            st.info(f"🔄 This webhook request (Hash: {webhook_hash}) has already been processed. Check the results dashboard.")
+            st.info(f"🔄 This webhook request (Hash: {webhook_hash[:16]}) has already been processed. Check the results dashboard.")
 
     # Handle quick question selection
     elif hasattr(st.session_state, 'selected_question'):
@@ -523,11 +691,15 @@ else:
         with st.chat_message("assistant"):
             with st.spinner("Analyzing security concerns..."):
                 try:
-                    response = chat_chain.invoke(
-                        {"input": user_input},
-                        config={"configurable": {"session_id": "default"}}
-                    )
-                    st.write(response.content)
+                    with timed("llm_call", model=chat_model):
+                        st.write_stream(
+                            chunk.content for chunk in chat_chain.stream(
+                                {"input": user_input},
+                                config={"configurable": {"session_id": history_session_id}}
+                            )
+                        )
+                except CircuitOpen:
+                    st.error("❌ The Gemini API is unavailable right now. Please try again shortly.")
                 except Exception as e:
                     error_msg = str(e)
                     if "404" in error_msg or "not found" in error_msg.lower():
@@ -538,7 +710,7 @@ else:
                         st.error(f"Error generating response: {error_msg}")
 
     # Display welcome message for new users
-    if len(st.session_state.chat_history.messages) == 0 and not is_webhook_request:
+    if len(chat_history.messages) == 0 and not is_webhook_request:
         st.markdown("""
         <div style="background: linear-gradient(135deg, #e6fffa 0%, #f0fdfa 100%); 
                     padding: 2rem; 
@@ -561,7 +733,10 @@ else:
                 </ul>
                 <p><strong>🔗 Webhook Integration Active:</strong> Ready to receive and analyze logs from Cribl Stream</p>
                 <p><strong>Current Webhook URL:</strong> <code>https://criblchatbot-hswvo3hhkgngsfvmwty9ql.streamlit.app/?prompt=YOUR_LOG_DATA</code></p>
+                <p><strong>Batch Ingest Endpoint:</strong> <code>POST http://&lt;host&gt;:8502/ingest</code> with JSON or NDJSON events from a Cribl HTTP destination</p>
                 <p><strong>Ask me a question, use quick questions, or send logs via webhook!</strong></p>
             </div>
         </div>
         """, unsafe_allow_html=True)
+
+PHASE_SECONDS.observe(time.perf_counter() - render_start, phase=render_phase)